@@ -0,0 +1,117 @@
+# app/answer_cache.py
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Configuration ---
+# Cached answers kept per document
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "128"))
+# Documents with a cache; the least recently used one is dropped beyond this
+ANSWER_CACHE_DOCS = int(os.getenv("ANSWER_CACHE_DOCS", "256"))
+# Seconds before a cached answer expires
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cosine similarity above which a different wording counts as the same question
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# doc_id -> OrderedDict(normalized question -> entry), both in LRU order
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip(" ?!.")
+
+
+def _expired(entry: dict, now: float) -> bool:
+    return now - entry["created_at"] > ANSWER_CACHE_TTL
+
+
+def _doc_entries(doc_id: str):
+    entries = _cache.get(doc_id)
+    if entries is not None:
+        _cache.move_to_end(doc_id)
+    return entries
+
+
+def get_exact(doc_id: str, question: str):
+    """
+    Return the cached entry for a question with the same normalized text, or None.
+    """
+    key = normalize_question(question)
+    now = time.time()
+    with _lock:
+        entries = _doc_entries(doc_id)
+        if not entries:
+            return None
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if _expired(entry, now):
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry
+
+
+def get_similar(doc_id: str, query_vector):
+    """
+    Return the cached entry whose question embedding is most similar to
+    `query_vector`, if that similarity reaches ANSWER_CACHE_SIMILARITY.
+    """
+    now = time.time()
+    with _lock:
+        entries = _doc_entries(doc_id)
+        if not entries:
+            return None
+        for key in [k for k, e in entries.items() if _expired(e, now)]:
+            del entries[key]
+        if not entries:
+            return None
+
+        keys = list(entries.keys())
+        matrix = np.stack([entries[k]["vector"] for k in keys])
+        vector = np.asarray(query_vector, dtype=np.float32)
+        scores = matrix @ (vector / (np.linalg.norm(vector) or 1.0))
+        best = int(np.argmax(scores))
+        if scores[best] < ANSWER_CACHE_SIMILARITY:
+            return None
+        entries.move_to_end(keys[best])
+        return entries[keys[best]]
+
+
+def store(doc_id: str, question: str, query_vector, answer: str, context: list, metadata: dict):
+    """
+    Cache an answer for a document, evicting the oldest entries beyond the limits.
+    """
+    vector = np.asarray(query_vector, dtype=np.float32)
+    entry = {
+        "question": question,
+        "vector": vector / (np.linalg.norm(vector) or 1.0),
+        "answer": answer,
+        "context": context,
+        "metadata": metadata,
+        "created_at": time.time(),
+    }
+    key = normalize_question(question)
+    with _lock:
+        entries = _doc_entries(doc_id)
+        if entries is None:
+            entries = _cache[doc_id] = OrderedDict()
+            while len(_cache) > ANSWER_CACHE_DOCS:
+                _cache.popitem(last=False)
+        entries[key] = entry
+        entries.move_to_end(key)
+        while len(entries) > ANSWER_CACHE_SIZE:
+            entries.popitem(last=False)
+
+
+def invalidate(doc_id: str):
+    """Drop every cached answer for a document (e.g. when it is re-ingested)."""
+    with _lock:
+        _cache.pop(doc_id, None)
@@ -0,0 +1,119 @@
+# app/chunker.py
+
+import os
+from bisect import bisect_right
+
+# --- Configuration ---
+# Maximum characters per chunk
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+# Characters repeated between consecutive chunks
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
+
+# Pages are joined with this to form the document text that chunk offsets refer to
+PAGE_SEPARATOR = "\n\n"
+
+# Preferred break points, best first. A chunk ends after the last one found in
+# the second half of its window, so chunks stay at least half full.
+_SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+def _break_point(text: str, lowest: int, limit: int) -> int:
+    """Return the end offset (exclusive) of a chunk that must end in [lowest, limit]."""
+    for separator in _SEPARATORS:
+        position = text.rfind(separator, lowest, limit)
+        if position != -1:
+            return position + len(separator)
+    return limit
+
+
+def _next_start(text: str, start: int, end: int, overlap: int) -> int:
+    """Where the chunk after text[start:end] begins: `overlap` back, moved to a word start."""
+    position = max(end - overlap, start + 1)
+    if position < end and not text[position - 1].isspace():
+        space = text.find(" ", position, end)
+        if space != -1:
+            position = space + 1
+    return position
+
+
+def _record(text: str, base: int, start: int, end: int, page_starts: list, page_numbers: list):
+    raw = text[start:end]
+    stripped = raw.strip()
+    if not stripped:
+        return None
+    first = base + start + len(raw) - len(raw.lstrip())
+    last = first + len(stripped)
+    return {
+        "text": stripped,
+        "page": page_numbers[bisect_right(page_starts, first) - 1],
+        "page_end": page_numbers[bisect_right(page_starts, last - 1) - 1],
+        "start": first,
+        "end": last,
+    }
+
+
+def iter_chunk_records(pages, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    """
+    Split a stream of (page_number, text) pages into overlapping chunks.
+
+    Chunks end on the best available break (paragraph, line, sentence, word)
+    and flow across page boundaries. Only the text not yet chunked is held in
+    memory, so pages can come straight from the PDF reader.
+
+    Args:
+        pages: Iterable of (page_number, text).
+        chunk_size: Maximum characters per chunk.
+        chunk_overlap: Characters repeated at the start of the next chunk.
+
+    Yields:
+        dict: {"text", "page", "page_end", "start", "end"}. `page` / `page_end`
+        are the pages holding the chunk's first and last character; `start` /
+        `end` are offsets into the document text (pages joined by PAGE_SEPARATOR).
+    """
+    if not 0 <= chunk_overlap < chunk_size:
+        raise ValueError("chunk_overlap must be smaller than chunk_size")
+
+    text = ""
+    # Document offset of text[0]
+    base = 0
+    # Offset in `text` where the next chunk starts
+    start = 0
+    # End of the last chunk emitted, so the tail isn't repeated as a chunk of its own
+    emitted_to = 0
+    page_starts, page_numbers = [], []
+
+    for page_number, page_text in pages:
+        if page_starts:
+            text += PAGE_SEPARATOR
+        page_starts.append(base + len(text))
+        page_numbers.append(page_number)
+        text += page_text
+
+        while len(text) - start > chunk_size:
+            end = _break_point(text, start + chunk_size // 2, start + chunk_size)
+            record = _record(text, base, start, end, page_starts, page_numbers)
+            if record is not None:
+                yield record
+            emitted_to = end
+            start = _next_start(text, start, end, chunk_overlap)
+
+        # Drop text (and pages) that no future chunk can reach
+        if start:
+            text = text[start:]
+            base += start
+            emitted_to -= start
+            start = 0
+            first_page = bisect_right(page_starts, base) - 1
+            if first_page > 0:
+                del page_starts[:first_page]
+                del page_numbers[:first_page]
+
+    if text[max(emitted_to, start):].strip():
+        record = _record(text, base, start, len(text), page_starts, page_numbers)
+        if record is not None:
+            yield record
+
+
+def chunk_pages(pages, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> list[dict]:
+    """List version of `iter_chunk_records`."""
+    return list(iter_chunk_records(pages, chunk_size, chunk_overlap))
@@ -0,0 +1,151 @@
+# app/context.py
+
+import os
+
+# --- Configuration ---
+# Approximate token budget for the context section of the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Hits whose vector similarity is below this are dropped (lexical-only hits are kept)
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", "0.2"))
+# Longest chunk overlap looked for when stitching neighbouring chunks together
+MAX_OVERLAP_CHARS = 300
+
+# Rough English average; close enough for budgeting without loading a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _hit_score(hit):
+    """Similarity used for the cutoff, or None if the hit came from BM25 only."""
+    if hasattr(hit, "vector_score"):
+        return hit.vector_score
+    return hit.score
+
+
+def _stitch(left: str, right: str, overlap: int = None) -> str:
+    """
+    Join two consecutive chunks, dropping the text they share. `overlap` is
+    the exact shared length when the chunks carry document offsets.
+    """
+    if overlap is not None:
+        return left + right[overlap:] if overlap > 0 else left + "\n" + right
+    if right in left:
+        return left
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def _pages(payload: dict) -> list:
+    """Pages a chunk spans; chunks stored before page_end existed only know their first."""
+    page = payload.get("page")
+    if page is None:
+        return []
+    return list(range(page, max(page, payload.get("page_end") or page) + 1))
+
+
+def _merge_runs(hits: list) -> list[dict]:
+    """
+    Group hits into runs of consecutive chunk_index within a document and
+    stitch each run into one passage. A run is ranked by its best member.
+    """
+    indexed, loose = [], []
+    for rank, hit in enumerate(hits):
+        if hit.payload.get("chunk_index") is None:
+            loose.append((rank, hit))
+        else:
+            indexed.append((rank, hit))
+    indexed.sort(key=lambda item: (str(item[1].payload.get("doc_id")), item[1].payload["chunk_index"]))
+
+    runs = []
+    previous = None
+    for rank, hit in indexed:
+        payload = hit.payload
+        key = (payload.get("doc_id"), payload["chunk_index"])
+        if previous is not None and key[0] == previous[0] and key[1] - previous[1] <= 1:
+            run = runs[-1]
+            if key[1] != previous[1]:
+                overlap = None
+                if run["end"] is not None and payload.get("start") is not None:
+                    overlap = run["end"] - payload["start"]
+                run["text"] = _stitch(run["text"], payload["text"], overlap)
+                run["end"] = payload.get("end")
+            run["rank"] = min(run["rank"], rank)
+            for page in _pages(payload):
+                if page not in run["pages"]:
+                    run["pages"].append(page)
+        else:
+            runs.append({
+                "text": payload["text"],
+                "rank": rank,
+                "pages": _pages(payload),
+                "doc_id": key[0],
+                "order": (str(key[0]), key[1]),
+                "end": payload.get("end"),
+            })
+        previous = key
+
+    # Chunks indexed before chunk_index existed can only be de-duplicated by text
+    seen = {run["text"] for run in runs}
+    for rank, hit in loose:
+        text = hit.payload["text"]
+        if text in seen:
+            continue
+        seen.add(text)
+        runs.append({
+            "text": text, "rank": rank, "pages": _pages(hit.payload),
+            "doc_id": hit.payload.get("doc_id"), "order": None, "end": None,
+        })
+    return runs
+
+
+def build_context(hits: list, token_budget: int = CONTEXT_TOKEN_BUDGET, min_score: float = CONTEXT_MIN_SCORE) -> list[dict]:
+    """
+    Turn ranked retrieval hits into the passages that go into the prompt.
+
+    Hits below `min_score` are dropped, neighbouring chunks are stitched
+    together without their repeated overlap, and passages are packed best
+    first until `token_budget` is reached. The result is in document order.
+
+    Args:
+        hits: Ranked hits with `payload` (and `score` / `vector_score`) attributes.
+        token_budget: Approximate tokens the passages may use in total.
+        min_score: Vector similarity cutoff.
+
+    Returns:
+        list[dict]: Passages as {"text", "doc_id", "page", "pages"}.
+    """
+    kept = []
+    for hit in hits:
+        if not hit.payload.get("text"):
+            continue
+        score = _hit_score(hit)
+        if score is not None and score < min_score:
+            continue
+        kept.append(hit)
+
+    packed = []
+    used = 0
+    for run in sorted(_merge_runs(kept), key=lambda r: r["rank"]):
+        tokens = estimate_tokens(run["text"])
+        if used + tokens > token_budget:
+            if packed:
+                continue
+            # Always keep the best passage, cut down to the budget
+            run["text"] = run["text"][:token_budget * CHARS_PER_TOKEN]
+            tokens = token_budget
+        packed.append(run)
+        used += tokens
+
+    packed.sort(key=lambda r: (r["order"] is None, r["order"] or ("", 0), r["rank"]))
+    return [
+        {
+            "text": run["text"], "doc_id": run["doc_id"],
+            "page": run["pages"][0] if run["pages"] else None, "pages": run["pages"],
+        }
+        for run in packed
+    ]
@@ -0,0 +1,26 @@
+# app/embed_worker.py
+#
+# Bulk embedding inside worker processes. Kept free of the app's other imports
+# so spawned workers start quickly; each worker loads its own model once.
+
+import numpy as np
+
+_model = None
+
+
+def init_worker(model_name: str, threads: int = None):
+    """Process-pool initializer: load the embedding model for this worker."""
+    global _model
+    from fastembed import TextEmbedding
+
+    _model = TextEmbedding(model_name, threads=threads)
+
+
+def embed_batch(texts: list[str], batch_size: int) -> np.ndarray:
+    """
+    Embed a shard of texts with this worker's model.
+
+    Returns:
+        np.ndarray: One row per text (a single array pickles much faster than a list).
+    """
+    return np.stack(list(_model.embed(texts, batch_size=batch_size)))
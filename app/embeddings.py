@@ -1,9 +1,59 @@
-from fastembed import TextEmbedding
 import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from . import metrics
 
 # Load embedding model from environment variable, fallback to default
 EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-small-en-v1.5")
-embedder = TextEmbedding(EMBED_MODEL)
+# Vector size produced by EMBED_MODEL; change it together with the model
+EMBED_DIM = int(os.getenv("EMBED_DIM", "384"))
+
+# The ONNX model is loaded on first use (or by the startup warmup), not at import
+_embedder = None
+_embedder_lock = threading.Lock()
+
+# --- Query embedding service ---
+# How long a query waits for others to join its batch
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+# Largest batch sent to the embedder in one call
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+# Number of query vectors kept in the LRU cache (0 disables it)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+
+# --- Bulk embedding (ingestion) ---
+# Texts per ONNX inference call when embedding chunks for ingestion
+EMBED_BULK_BATCH_SIZE = int(os.getenv("EMBED_BULK_BATCH_SIZE", "256"))
+# Worker processes embedding shards of a batch in parallel (1 = one model instance in this process)
+EMBED_BULK_PROCESSES = int(os.getenv("EMBED_BULK_PROCESSES", "1"))
+# ONNX intra-op threads per bulk model (0 = onnxruntime's default, or the cores split between workers)
+EMBED_BULK_THREADS = int(os.getenv("EMBED_BULK_THREADS", "0"))
+
+# Ingestion never shares a model with the query embedder, so backfills don't queue behind
+# (or in front of) latency-sensitive query batches
+_bulk_embedder = None
+_bulk_pool = None
+_bulk_lock = threading.Lock()
+
+
+def get_embedder():
+    """Return the shared FastEmbed model, loading it on first use."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                from fastembed import TextEmbedding
+                _embedder = TextEmbedding(EMBED_MODEL)
+    return _embedder
+
+
+def embedder_loaded() -> bool:
+    """True once the embedding model has been loaded."""
+    return _embedder is not None
 
 
 def embed_text(texts):
@@ -19,15 +69,176 @@ def embed_text(texts):
     if isinstance(texts, str):
         texts = [texts]
 
-    embeddings = embedder.embed(texts)
+    embeddings = get_embedder().embed(texts)
     return list(embeddings)
-from fastembed import TextEmbedding
-import os
 
-EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-small-en-v1.5")
-embedder = TextEmbedding(EMBED_MODEL)
 
-def embed_text(texts):
-    if isinstance(texts, str):
-        texts = [texts]
-    return list(embedder.embed(texts))
+def _bulk_threads():
+    if EMBED_BULK_THREADS > 0:
+        return EMBED_BULK_THREADS
+    if EMBED_BULK_PROCESSES > 1:
+        # Don't let every worker spin up one thread per core
+        return max(1, (os.cpu_count() or 1) // EMBED_BULK_PROCESSES)
+    return None
+
+
+def get_bulk_embedder():
+    """Return the in-process FastEmbed model used for ingestion, loading it on first use."""
+    global _bulk_embedder
+    if _bulk_embedder is None:
+        with _bulk_lock:
+            if _bulk_embedder is None:
+                from fastembed import TextEmbedding
+                _bulk_embedder = TextEmbedding(EMBED_MODEL, threads=_bulk_threads())
+    return _bulk_embedder
+
+
+def _get_bulk_pool() -> ProcessPoolExecutor:
+    """Return the bulk-embedding process pool, creating it on first use."""
+    global _bulk_pool
+    if _bulk_pool is None:
+        with _bulk_lock:
+            if _bulk_pool is None:
+                from .embed_worker import init_worker
+
+                # spawn, not fork: the parent has ONNX and HTTP threads running
+                _bulk_pool = ProcessPoolExecutor(
+                    max_workers=EMBED_BULK_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                    initargs=(EMBED_MODEL, _bulk_threads()),
+                )
+    return _bulk_pool
+
+
+def embed_bulk(texts: list[str]) -> list:
+    """
+    Embed many texts for ingestion, in EMBED_BULK_BATCH_SIZE inference batches.
+
+    With EMBED_BULK_PROCESSES > 1 the texts are split into shards that are
+    embedded in parallel on a process pool (one model per worker); otherwise a
+    dedicated in-process model is used. Throughput is recorded as the
+    "embed_bulk" stage and `app_embed_bulk_chunks_total`. Passing
+    EMBED_BULK_BATCH_SIZE * EMBED_BULK_PROCESSES texts per call (the ingestion
+    default) gives each worker one full batch.
+
+    Returns:
+        list: One embedding vector per text, in input order.
+    """
+    if not texts:
+        return []
+    start = time.perf_counter()
+    if EMBED_BULK_PROCESSES <= 1:
+        vectors = list(get_bulk_embedder().embed(texts, batch_size=EMBED_BULK_BATCH_SIZE))
+    else:
+        from .embed_worker import embed_batch
+
+        # Enough shards to keep every worker busy, none larger than one inference batch
+        shard_size = max(1, min(EMBED_BULK_BATCH_SIZE, -(-len(texts) // EMBED_BULK_PROCESSES)))
+        pool = _get_bulk_pool()
+        shards = [
+            pool.submit(embed_batch, texts[i:i + shard_size], shard_size)
+            for i in range(0, len(texts), shard_size)
+        ]
+        vectors = [vector for shard in shards for vector in shard.result()]
+    metrics.record("embed_bulk", time.perf_counter() - start)
+    metrics.embed_bulk_chunks_total.inc(len(texts))
+    return vectors
+
+
+class QueryEmbedder:
+    """
+    Coalesces concurrent query embeddings into batched `embed_text` calls.
+
+    Requests arriving within `window_ms` of each other (up to `max_batch`) are
+    embedded together on a dedicated thread, so the event loop never runs
+    inference. Repeated query strings are served from an LRU cache.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int, cache_size: int):
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending = []
+        self._flush_handle = None
+        # One inference at a time; requests that arrive meanwhile form the next batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-query")
+
+    def _cache_get(self, text: str):
+        with self._cache_lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+            return vector
+
+    def _cache_put(self, text: str, vector):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def embed(self, text: str):
+        """
+        Return the embedding vector for a single query string.
+        """
+        vector = self._cache_get(text)
+        if vector is not None:
+            return vector
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush, loop)
+
+        return await future
+
+    def _flush(self, loop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            loop.create_task(self._run_batch(loop, batch))
+
+    async def _run_batch(self, loop, batch):
+        # Identical questions in the same window are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        start = time.perf_counter()
+        try:
+            vectors = await loop.run_in_executor(self._executor, embed_text, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Shared by every request in the batch, so kept out of their per-request timings
+        metrics.stage_seconds.observe(time.perf_counter() - start, stage="embed_batch")
+        metrics.embed_batch_size.observe(len(texts))
+
+        by_text = dict(zip(texts, vectors))
+        for text, vector in by_text.items():
+            self._cache_put(text, vector)
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+
+query_embedder = QueryEmbedder(EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH, EMBED_CACHE_SIZE)
+
+
+async def embed_query(text: str):
+    """
+    Embed a single query string through the shared micro-batching service.
+    """
+    with metrics.timed("embed_query"):
+        return await query_embedder.embed(text)
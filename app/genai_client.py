@@ -1,12 +1,12 @@
-import os
-from groq import AsyncGroq
+import time
 from dotenv import load_dotenv
 
+from . import metrics
+from . import groq_scheduler
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the ASYNCHRONOUS Groq client once
-groq_client = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
 
 async def answer_with_groq_async(prompt: str, stream: bool = False):
     """
@@ -26,19 +26,39 @@ async def answer_with_groq_async(prompt: str, stream: bool = False):
     if not stream:
         # --- Standard non-streaming behavior ---
         # Await the single API call and return the result directly.
-        chat_completion = await groq_client.chat.completions.create(**params)
+        try:
+            with metrics.timed("llm"):
+                chat_completion = await groq_scheduler.complete_async(params)
+        except Exception:
+            metrics.llm_errors_total.inc()
+            raise
         return chat_completion.choices[0].message.content
     else:
         # --- Streaming behavior ---
         # This defines a new async generator function that will be returned.
         async def generator():
-            # Start the streaming API call
-            stream_completion = await groq_client.chat.completions.create(**params, stream=True)
-            # Iterate over the async stream of chunks
-            async for chunk in stream_completion:
-                content = chunk.choices[0].delta.content
-                if content is not None:
-                    yield content # Yield each piece of content as it arrives
+            start = time.perf_counter()
+            first_token = None
+            # The scheduler waits for a slot, opens the stream (with retries) and
+            # holds the slot until the stream is closed
+            stream_completion = groq_scheduler.stream_async(params)
+            try:
+                # Iterate over the async stream of chunks
+                async for chunk in stream_completion:
+                    content = chunk.choices[0].delta.content
+                    if content is not None:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                            metrics.record("llm_first_token", first_token)
+                        yield content # Yield each piece of content as it arrives
+            except Exception:
+                metrics.llm_errors_total.inc()
+                raise
+            finally:
+                # Runs on normal completion and when the consumer stops early (client
+                # disconnect): release the HTTP response so Groq stops generating
+                await stream_completion.aclose()
+            metrics.record("llm_stream", time.perf_counter() - start)
         
         # Return the generator object itself, NOT the result of calling it.
         return generator()
\ No newline at end of file
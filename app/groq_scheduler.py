@@ -0,0 +1,356 @@
+# app/groq_scheduler.py
+#
+# Every Groq call (chat answers and page OCR) goes through one scheduler per
+# process. It owns the pooled clients, keeps request- and token-per-minute
+# budgets, serves interactive chat before background OCR, and retries
+# rate-limited or failed calls with jittered backoff.
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+
+from dotenv import load_dotenv
+
+from . import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Requests and tokens per minute allowed by the Groq plan (0 = no limit), for the whole
+# deployment: each worker process gets an equal share (see GROQ_WORKERS)
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "0"))
+# Processes sharing the Groq quota (defaults to the uvicorn worker count)
+GROQ_WORKERS = max(1, int(os.getenv("GROQ_WORKERS", os.getenv("WEB_CONCURRENCY", "1"))))
+# Groq calls in flight at once, per process (streams hold their slot until they finish)
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+# Share of each budget background work leaves untouched for interactive requests
+GROQ_INTERACTIVE_RESERVE = float(os.getenv("GROQ_INTERACTIVE_RESERVE", "0.2"))
+# Retries after a rate limit, server error or connection failure
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "5"))
+GROQ_BACKOFF_BASE = float(os.getenv("GROQ_BACKOFF_BASE", "1.0"))
+GROQ_BACKOFF_MAX = float(os.getenv("GROQ_BACKOFF_MAX", "30"))
+
+# Token estimates used to reserve budget before the real usage is known
+COMPLETION_TOKENS_ESTIMATE = 512
+IMAGE_TOKENS_ESTIMATE = 1500
+
+# Priorities: lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class _Bucket:
+    """Token bucket refilled continuously at `per_minute / 60` per second."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self, elapsed: float):
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + elapsed * self.rate)
+
+    def shortfall(self, amount: float, reserve: float) -> float:
+        """
+        Seconds until `amount` can be taken while leaving `reserve` of capacity.
+        Amounts larger than the unreserved part wait for a full bucket rather
+        than forever.
+        """
+        if self.unlimited:
+            return 0.0
+        usable = self.capacity * (1 - reserve)
+        need = min(amount, usable) + reserve * self.capacity - self.level
+        return max(0.0, need / self.rate)
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "wake", "granted", "cancelled")
+
+    def __init__(self, priority: int, tokens: int, wake):
+        self.priority = priority
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class GroqScheduler:
+    """
+    Grants Groq calls in priority order within the RPM / TPM budgets and the
+    concurrency limit. A background thread hands out grants, so both
+    event-loop code (`acquire_async`) and worker threads (`acquire`) can wait.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int, interactive_reserve: float):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.interactive_reserve = interactive_reserve
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._updated = time.monotonic()
+        self._queue = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="groq-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        with self._cond:
+            while True:
+                self._cond.wait(self._dispatch())
+
+    def _dispatch(self):
+        """Grant what the budgets allow; return seconds until the next check (None = wait for a change)."""
+        now = time.monotonic()
+        self.requests.refill(now - self._updated)
+        self.tokens.refill(now - self._updated)
+        self._updated = now
+
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight >= self.max_concurrency:
+                return None
+            reserve = self.interactive_reserve if waiter.priority > INTERACTIVE else 0.0
+            delay = max(
+                self._paused_until - now,
+                self.requests.shortfall(1, reserve),
+                self.tokens.shortfall(waiter.tokens, reserve),
+            )
+            if delay > 0:
+                return delay
+
+            heapq.heappop(self._queue)
+            self.requests.level -= 1
+            self.tokens.level -= min(waiter.tokens, self.tokens.capacity)
+            self.in_flight += 1
+            waiter.granted = True
+            waiter.wake()
+        return None
+
+    def _enqueue(self, waiter: _Waiter):
+        with self._cond:
+            self._start()
+            heapq.heappush(self._queue, (waiter.priority, next(self._order), waiter))
+            self._cond.notify()
+
+    def acquire(self, tokens: int, priority: int = BACKGROUND):
+        """Block the calling thread until a call with `tokens` may start."""
+        event = threading.Event()
+        with metrics.timed("groq_wait"):
+            self._enqueue(_Waiter(priority, tokens, event.set))
+            event.wait()
+
+    async def acquire_async(self, tokens: int, priority: int = INTERACTIVE):
+        """Wait (without blocking the event loop) until a call with `tokens` may start."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = _Waiter(priority, tokens, wake)
+        self._enqueue(waiter)
+        try:
+            with metrics.timed("groq_wait"):
+                await future
+        except asyncio.CancelledError:
+            with self._cond:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self.release(tokens, 0)
+            raise
+
+    def release(self, reserved_tokens: int, used_tokens: int = None):
+        """Finish a granted call, settling its token reservation against real usage."""
+        with self._cond:
+            self.in_flight -= 1
+            if used_tokens is not None and not self.tokens.unlimited:
+                self.tokens.level += min(reserved_tokens, self.tokens.capacity) - used_tokens
+            self._cond.notify()
+
+    def pause(self, seconds: float):
+        """Hold every grant for `seconds` (after Groq reports a rate limit)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify()
+
+
+def _per_worker(budget: int) -> int:
+    """This process's share of a per-minute budget (0 stays unlimited)."""
+    return max(1, budget // GROQ_WORKERS) if budget > 0 else 0
+
+
+scheduler = GroqScheduler(
+    _per_worker(GROQ_RPM), _per_worker(GROQ_TPM), GROQ_MAX_CONCURRENCY, GROQ_INTERACTIVE_RESERVE
+)
+
+# --- Pooled clients ---
+# Retries are done here, so the SDK's own are turned off
+
+_client = None
+_async_client = None
+_clients_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared sync Groq client (used from worker threads)."""
+    global _client
+    if _client is None:
+        with _clients_lock:
+            if _client is None:
+                from groq import Groq
+
+                api_key = os.environ.get("GROQ_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GROQ_API_KEY not set in environment")
+                _client = Groq(api_key=api_key, max_retries=0)
+    return _client
+
+
+def get_async_client():
+    """Return the shared AsyncGroq client."""
+    global _async_client
+    if _async_client is None:
+        from groq import AsyncGroq
+
+        _async_client = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=0)
+    return _async_client
+
+
+def estimate_tokens(params: dict) -> int:
+    """Rough prompt + completion tokens for a chat completion request."""
+    tokens = params.get("max_tokens") or COMPLETION_TOKENS_ESTIMATE
+    for message in params["messages"]:
+        content = message["content"]
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                tokens += IMAGE_TOKENS_ESTIMATE
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return tokens
+
+
+def _retry_delay(error, attempt: int):
+    """Seconds to wait before retrying `error`, or None if it shouldn't be retried."""
+    import groq
+
+    if not isinstance(error, (groq.RateLimitError, groq.InternalServerError, groq.APIConnectionError)):
+        return None
+    if attempt >= GROQ_MAX_RETRIES:
+        return None
+    delay = min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    if isinstance(error, groq.RateLimitError):
+        # The quota is shared: hold everyone, not just this call
+        scheduler.pause(delay)
+    return delay
+
+
+def _used_tokens(completion):
+    usage = getattr(completion, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def complete(params: dict, priority: int = BACKGROUND):
+    """Run a chat completion from a worker thread under the scheduler, with retries."""
+    tokens = estimate_tokens(params)
+    attempt = 0
+    while True:
+        scheduler.acquire(tokens, priority)
+        used = None
+        try:
+            completion = get_client().chat.completions.create(**params)
+            used = _used_tokens(completion)
+            return completion
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            metrics.groq_retries_total.inc(priority="background" if priority else "interactive")
+            logger.warning("Groq call failed (%s), retrying in %.1fs", type(e).__name__, delay)
+        finally:
+            scheduler.release(tokens, used)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def complete_async(params: dict, priority: int = INTERACTIVE):
+    """Run a chat completion on the event loop under the scheduler, with retries."""
+    tokens = estimate_tokens(params)
+    attempt = 0
+    while True:
+        await scheduler.acquire_async(tokens, priority)
+        used = None
+        try:
+            completion = await get_async_client().chat.completions.create(**params)
+            used = _used_tokens(completion)
+            return completion
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            metrics.groq_retries_total.inc(priority="background" if priority else "interactive")
+            logger.warning("Groq call failed (%s), retrying in %.1fs", type(e).__name__, delay)
+        finally:
+            scheduler.release(tokens, used)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def stream_async(params: dict, priority: int = INTERACTIVE):
+    """
+    Stream a chat completion under the scheduler. Opening the stream is
+    retried; the slot is held until the stream is exhausted or closed.
+    """
+    tokens = estimate_tokens(params)
+    attempt = 0
+    while True:
+        await scheduler.acquire_async(tokens, priority)
+        try:
+            stream = await get_async_client().chat.completions.create(**params, stream=True)
+        except Exception as e:
+            scheduler.release(tokens)
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            metrics.groq_retries_total.inc(priority="background" if priority else "interactive")
+            logger.warning("Groq stream failed to open (%s), retrying in %.1fs", type(e).__name__, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.close()
+            scheduler.release(tokens)
+        return
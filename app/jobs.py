@@ -0,0 +1,251 @@
+# app/jobs.py
+
+import os
+import time
+import uuid
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .state import uploaded_docs, doc_hashes, job_records, clear_chat_history
+from .utils import ingest_pdf, delete_doc_vectors, INGEST_STAGES
+from . import answer_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Number of PDFs that may be ingested at the same time
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Finished jobs kept around for /jobs/{id} lookups before the oldest are dropped
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "500"))
+# Seconds without a heartbeat after which an unfinished job counts as interrupted
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Job records live in the shared state database (job_id -> record) so any
+# worker process can answer /jobs/{id}; the lock serializes this process's updates
+jobs = job_records
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+# Jobs queued or running in this process; their leases are renewed by the job monitor
+_active_jobs = set()
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def _new_job(doc_id: str, filename: str, content_hash: str = None, size: int = None) -> dict:
+    now = time.time()
+    return {
+        "id": str(uuid.uuid4()),
+        "doc_id": doc_id,
+        "filename": filename,
+        "content_hash": content_hash,
+        # Upload size in bytes
+        "bytes": size,
+        "status": "queued",
+        "stage": None,
+        # Seconds spent so far in each pipeline stage (they run interleaved)
+        "stages": {name: 0.0 for name in INGEST_STAGES},
+        "pages": 0,
+        "chunks": 0,
+        # Embedding throughput of the finished job
+        "embed_chunks_per_second": None,
+        "queryable": False,
+        "error": None,
+        "created_at": now,
+        # Doubles as the job's lease: renewed while the job is queued or running
+        "updated_at": now,
+    }
+
+
+def _prune_jobs():
+    """Drop the oldest finished jobs once the registry grows past JOB_RETENTION."""
+    all_jobs = jobs.values()
+    excess = len(all_jobs) - JOB_RETENTION
+    if excess <= 0:
+        return
+    finished = [j for j in all_jobs if j["status"] in ("done", "failed")]
+    finished.sort(key=lambda j: j["updated_at"])
+    for job in finished[:excess]:
+        jobs.pop(job["id"], None)
+
+
+def _update_job(job_id: str, **fields):
+    with _jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        job["updated_at"] = time.time()
+        jobs[job_id] = job
+
+
+def _interrupted(job: dict) -> bool:
+    """True if an unfinished job's lease has expired (its process stopped renewing it)."""
+    if job["status"] not in ("queued", "running") or job["id"] in _active_jobs:
+        return False
+    return time.time() - job["updated_at"] > JOB_LEASE_SECONDS
+
+
+def _discard_document(doc_id: str, content_hash: str = None):
+    """Remove everything a failed ingestion left behind for `doc_id`."""
+    uploaded_docs.pop(doc_id, None)
+    clear_chat_history(doc_id)
+    try:
+        delete_doc_vectors(doc_id)
+    except Exception:
+        traceback.print_exc()
+    answer_cache.invalidate(doc_id)
+    # Let the next upload of the same bytes try again
+    if content_hash and doc_hashes.get(content_hash) == doc_id:
+        doc_hashes.pop(content_hash, None)
+
+
+def _fail_interrupted(job: dict) -> dict:
+    """Persist an interrupted job as failed and drop its half-ingested document."""
+    logger.warning("Ingestion job %s was interrupted by a server restart", job["id"])
+    _update_job(job["id"], status="failed", stage=None, queryable=False, error="Interrupted by a server restart")
+    _discard_document(job["doc_id"], job.get("content_hash"))
+    return jobs.get(job["id"]) or job
+
+
+def recover_interrupted_jobs() -> int:
+    """
+    Fail every job cut short by a restart and clean up its document.
+
+    Returns:
+        int: Number of jobs recovered.
+    """
+    unfinished = jobs.find("status", "queued") + jobs.find("status", "running")
+    interrupted = [job for job in unfinished if _interrupted(job)]
+    for job in interrupted:
+        _fail_interrupted(job)
+    return len(interrupted)
+
+
+def _monitor_jobs():
+    while True:
+        for job_id in list(_active_jobs):
+            # Bumps updated_at, renewing the lease
+            _update_job(job_id)
+        try:
+            recovered = recover_interrupted_jobs()
+            if recovered:
+                logger.warning("Cleaned up %d ingestion jobs interrupted by a restart", recovered)
+        except Exception:
+            traceback.print_exc()
+        time.sleep(JOB_LEASE_SECONDS / 4)
+
+
+def start_job_monitor():
+    """
+    Start this process's job monitor thread (once). It renews the leases of
+    the jobs queued or running here and cleans up jobs whose lease expired.
+    """
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = threading.Thread(target=_monitor_jobs, name="job-monitor", daemon=True)
+                _monitor.start()
+
+
+def get_job(job_id: str):
+    """
+    Return a snapshot of a job record, or None if the job is unknown.
+
+    A job whose lease has expired is reported as failed; the job monitor
+    persists that and removes its document.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return None
+    if _interrupted(job):
+        job.update(status="failed", stage=None, queryable=False, error="Interrupted by a server restart")
+    return job
+
+
+def find_job_for_doc(doc_id: str):
+    """
+    Return a snapshot of the most recent job that ingests `doc_id`, or None.
+    """
+    matches = jobs.find("doc_id", doc_id)
+    if not matches:
+        return None
+    return get_job(max(matches, key=lambda j: j["created_at"])["id"])
+
+
+def _ingest(job_id: str, saved_path: str, doc_id: str, filename: str, content_hash: str = None, size: int = None):
+    """
+    Run the streaming ingestion pipeline for one PDF on a worker thread.
+    """
+    _update_job(job_id, status="running", stage="ingesting")
+    # Answers cached against an earlier ingestion of this doc_id are stale now
+    answer_cache.invalidate(doc_id)
+
+    def on_progress(stats):
+        # Called for page progress too; the document is searchable once a batch is stored
+        queryable = stats["chunks"] > 0
+        if queryable and doc_id not in uploaded_docs:
+            # The first batch is searchable, so /ask/ can use the document already
+            uploaded_docs[doc_id] = {
+                "filename": filename, "path": saved_path, "sha256": content_hash, "bytes": size,
+                "status": "ingesting",
+            }
+        _update_job(
+            job_id,
+            pages=stats["pages"],
+            chunks=stats["chunks"],
+            queryable=queryable,
+            stages={k: round(v, 3) for k, v in stats["seconds"].items()},
+        )
+
+    try:
+        stats = ingest_pdf(saved_path, doc_id, on_progress=on_progress)
+
+        uploaded_docs[doc_id] = {
+            "filename": filename, "path": saved_path, "sha256": content_hash, "bytes": size, "status": "ready",
+        }
+
+        _update_job(
+            job_id,
+            status="done",
+            stage=None,
+            pages=stats["pages"],
+            chunks=stats["chunks"],
+            stages={k: round(v, 3) for k, v in stats["seconds"].items()},
+            embed_chunks_per_second=round(stats["chunks_per_second"], 1),
+        )
+        # Drop answers given while only part of the document was searchable
+        answer_cache.invalidate(doc_id)
+    except Exception as e:
+        logger.error("Ingestion job %s failed: %s", job_id, e)
+        traceback.print_exc()
+        # Don't leave a half-ingested document behind
+        _discard_document(doc_id, content_hash)
+        _update_job(job_id, status="failed", queryable=False, error=str(e))
+    finally:
+        _active_jobs.discard(job_id)
+
+
+def submit_ingestion(saved_path: str, doc_id: str, filename: str, content_hash: str = None, size: int = None) -> dict:
+    """
+    Queue a saved PDF for background ingestion.
+
+    If `content_hash` is given it is registered as belonging to `doc_id`, so
+    later uploads of identical bytes can be resolved to this document.
+    `size` is the upload's byte count, recorded with the job and document.
+
+    Returns:
+        dict: Snapshot of the newly created job record.
+    """
+    job = _new_job(doc_id, filename, content_hash, size)
+    _active_jobs.add(job["id"])
+    start_job_monitor()
+    with _jobs_lock:
+        jobs[job["id"]] = job
+        _prune_jobs()
+    if content_hash:
+        doc_hashes[content_hash] = doc_id
+    _executor.submit(_ingest, job["id"], saved_path, doc_id, filename, content_hash, size)
+    return get_job(job["id"])
@@ -0,0 +1,181 @@
+# app/lexical_index.py
+
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from . import metrics
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(BASE_DIR, "../lexical_index"))
+
+# BM25 parameters
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Documents whose index is kept in memory; the least recently searched are dropped beyond this
+LEXICAL_CACHE_DOCS = int(os.getenv("LEXICAL_CACHE_DOCS", "64"))
+
+# Keeps part numbers, chemical names and section ids ("AB-12", "3.2.1", "h2o") as one token
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by does do for from how in is it of on or the this that to was what "
+    "when where which who why with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index over one document's chunks."""
+
+    def __init__(self):
+        self.payloads = []
+        self.lengths = []
+        self.total_length = 0
+        # term -> {chunk position: term frequency}
+        self.postings = defaultdict(dict)
+
+    def add(self, payloads: list[dict]):
+        for payload in payloads:
+            position = len(self.payloads)
+            tokens = tokenize(payload.get("text", ""))
+            for term, count in Counter(tokens).items():
+                self.postings[term][position] = count
+            self.payloads.append(payload)
+            self.lengths.append(len(tokens))
+            self.total_length += len(tokens)
+
+    def search(self, query: str, top_k: int) -> list[tuple[float, dict]]:
+        """
+        Return up to `top_k` (score, payload) pairs, best first.
+        """
+        n = len(self.payloads)
+        if n == 0:
+            return []
+        avg_length = self.total_length / n or 1.0
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for position, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / avg_length)
+                scores[position] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, self.payloads[position]) for position, score in best]
+
+
+# doc_id -> (byte offset just past the last indexed line of the chunk file, BM25Index)
+# (LRU order: most recently used last)
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _path(doc_id: str) -> str:
+    return os.path.join(LEXICAL_INDEX_DIR, f"{doc_id}.jsonl")
+
+
+def add_chunks(doc_id: str, payloads: list[dict]):
+    """
+    Index a batch of chunk payloads for a document and persist them, so other
+    worker processes (and restarts) can rebuild the index without re-ingesting.
+    """
+    if not payloads:
+        return
+    path = _path(doc_id)
+    with _lock:
+        os.makedirs(LEXICAL_INDEX_DIR, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for payload in payloads:
+                f.write(json.dumps(payload) + "\n")
+        size = os.path.getsize(path)
+
+        cached = _indexes.get(doc_id)
+        if cached is not None:
+            cached[1].add(payloads)
+            _indexes[doc_id] = (size, cached[1])
+        # Otherwise the index is built from the file on first search
+
+
+def _get_index(doc_id: str):
+    path = _path(doc_id)
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+
+    cached = _indexes.get(doc_id)
+    if cached is not None and cached[0] == size:
+        try:
+            _indexes.move_to_end(doc_id)
+        except KeyError:
+            # Evicted meanwhile; this search can still use it
+            pass
+        return cached[1]
+
+    with _lock:
+        # Pick up from the last indexed line when the file has only grown
+        if cached is not None and cached[0] <= size:
+            offset, index = cached
+        else:
+            offset, index = 0, BM25Index()
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        # Another process may still be appending the last line; index complete lines only
+        end = data.rfind(b"\n") + 1
+        if end:
+            index.add([json.loads(line) for line in data[:end].decode("utf-8").splitlines() if line.strip()])
+        _indexes[doc_id] = (offset + end, index)
+        _indexes.move_to_end(doc_id)
+        while len(_indexes) > max(1, LEXICAL_CACHE_DOCS):
+            _indexes.popitem(last=False)
+    return index
+
+
+def search(doc_id, query: str, top_k: int) -> list[tuple[float, dict]]:
+    """
+    BM25 search over one document's chunks (a doc_id) or several documents'
+    (a list of doc_ids); documents without an index are skipped.
+
+    BM25 scores from separate documents aren't comparable (each index has its
+    own document frequencies and average length), so multi-document results
+    are merged by their rank within each document, best score breaking ties.
+    """
+    doc_ids = [doc_id] if isinstance(doc_id, str) else doc_id
+    with metrics.timed("lexical_search"):
+        return _search(doc_ids, query, top_k)
+
+
+def _search(doc_ids: list, query: str, top_k: int) -> list[tuple[float, dict]]:
+    if len(doc_ids) == 1:
+        index = _get_index(doc_ids[0])
+        return index.search(query, top_k) if index is not None else []
+    ranked = []
+    for doc_id in doc_ids:
+        index = _get_index(doc_id)
+        if index is not None:
+            ranked.extend((rank, hit) for rank, hit in enumerate(index.search(query, top_k)))
+    ranked.sort(key=lambda item: (item[0], -item[1][0]))
+    return [hit for _, hit in ranked[:top_k]]
+
+
+def delete(doc_id: str):
+    with _lock:
+        _indexes.pop(doc_id, None)
+        try:
+            os.remove(_path(doc_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,152 @@
+# app/metrics.py
+#
+# Minimal Prometheus-style metrics (counters and histograms) and per-request
+# stage timings, without a client library. Values are per worker process.
+
+import os
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# --- Configuration ---
+# Add a Server-Timing header with the request's stage breakdown
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "1") == "1"
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_metrics = {}
+
+# stage -> seconds for the request being handled (None outside a request)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _metrics.setdefault(name, Counter(name, help_text))
+
+
+def histogram(name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return _metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_metrics.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Stage timings ---
+
+stage_seconds = histogram("app_stage_seconds", "Time spent in each processing stage")
+requests_total = counter("app_requests_total", "HTTP requests by route and status")
+request_seconds = histogram("app_request_seconds", "HTTP request latency by route (until the response starts)")
+answer_cache_total = counter("app_answer_cache_total", "Answer cache lookups by result")
+llm_errors_total = counter("app_llm_errors_total", "Failed Groq completions")
+groq_retries_total = counter("app_groq_retries_total", "Groq calls retried after a rate limit or transient error")
+ingest_pages_total = counter("app_ingest_pages_total", "Ingested PDF pages by text source")
+ocr_cache_total = counter("app_ocr_cache_total", "OCR cache lookups by result")
+ocr_cache_evictions_total = counter("app_ocr_cache_evictions_total", "Pages evicted from the OCR cache")
+embed_bulk_chunks_total = counter("app_embed_bulk_chunks_total", "Chunks embedded for ingestion")
+embed_batch_size = histogram("app_embed_batch_size", "Queries per embedding batch", (1, 2, 4, 8, 16, 32, 64, 128))
+
+
+def record(stage: str, seconds: float):
+    """Record a stage duration in the histogram and in the current request's breakdown."""
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as `stage` (see `record`)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def start_request() -> contextvars.Token:
+    """Begin collecting stage timings for the current request."""
+    return _request_timings.set({})
+
+
+def finish_request(token: contextvars.Token) -> dict:
+    """Stop collecting and return the request's stage timings (seconds)."""
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings: dict) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
@@ -0,0 +1,107 @@
+# app/ocr_cache.py
+#
+# Disk-backed cache of VLM output per page. Entries are keyed on the rendered
+# page image plus the model and prompt, so a page that shows up again (in
+# another PDF, a re-upload or a re-ingestion) is only sent to Groq once.
+# Lives in its own SQLite file (WAL mode), shared by every worker process.
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+
+from . import metrics
+from .state import open_wal_connection
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration ---
+# Set to 0 to always send pages to the VLM
+OCR_CACHE = os.getenv("OCR_CACHE", "1") == "1"
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", os.path.join(BASE_DIR, "../ocr_cache.db"))
+# Total size of cached text, in megabytes; least recently used pages are evicted beyond it
+OCR_CACHE_MAX_MB = float(os.getenv("OCR_CACHE_MAX_MB", "256"))
+OCR_CACHE_MAX_BYTES = int(OCR_CACHE_MAX_MB * 1024 * 1024)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_pages (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ocr_pages_lru ON ocr_pages (last_used);
+"""
+
+def _conn() -> sqlite3.Connection:
+    return open_wal_connection(OCR_CACHE_DB, _SCHEMA)
+
+
+def page_key(image_bytes: bytes, model: str, prompt: str) -> str:
+    """Cache key for a rendered page image sent to `model` with `prompt`."""
+    digest = hashlib.sha256()
+    for part in (model.encode("utf-8"), prompt.encode("utf-8")):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+def get(key: str):
+    """Return the cached text for `key` (marking it recently used), or None."""
+    if not OCR_CACHE:
+        return None
+    try:
+        conn = _conn()
+        row = conn.execute("SELECT text FROM ocr_pages WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE ocr_pages SET last_used = ? WHERE key = ?", (time.time(), key))
+    except sqlite3.Error as e:
+        # The cache is an optimization; never fail a page because of it
+        logger.warning("OCR cache lookup failed: %s", e)
+        row = None
+    metrics.ocr_cache_total.inc(result="hit" if row is not None else "miss")
+    return row[0] if row is not None else None
+
+
+def put(key: str, model: str, text: str):
+    """Store the VLM output for `key`, evicting least recently used pages over OCR_CACHE_MAX_BYTES."""
+    if not OCR_CACHE:
+        return
+    size = len(text.encode("utf-8"))
+    now = time.time()
+    try:
+        conn = _conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages (key, model, text, bytes, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, text, size, now, now),
+            )
+            _evict(conn, OCR_CACHE_MAX_BYTES)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.Error as e:
+        logger.warning("OCR cache store failed: %s", e)
+
+
+def _evict(conn: sqlite3.Connection, max_bytes: int):
+    total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM ocr_pages").fetchone()[0]
+    while total > max_bytes:
+        oldest = conn.execute("SELECT key, bytes FROM ocr_pages ORDER BY last_used LIMIT 64").fetchall()
+        if not oldest:
+            break
+        for key, size in oldest:
+            if total <= max_bytes:
+                break
+            conn.execute("DELETE FROM ocr_pages WHERE key = ?", (key,))
+            total -= size
+            metrics.ocr_cache_evictions_total.inc()
@@ -0,0 +1,18 @@
+# app/pdf_text.py
+#
+# Text-layer extraction that runs inside worker processes. Kept free of the
+# embedding / Qdrant imports so spawned workers start quickly.
+
+import pdfplumber
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> list[str]:
+    """
+    Extract the text layer of pages [start, end) (0-based) from a PDF.
+
+    Returns:
+        list[str]: One string per page, empty when the page has no text layer.
+    """
+    page_numbers = list(range(start + 1, end + 1))
+    with pdfplumber.open(file_path, pages=page_numbers) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
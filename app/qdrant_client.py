@@ -1,82 +1,120 @@
 import os
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from .embeddings import embed_text
-import uuid
+import time
+import logging
+import threading
+
+from .qdrant_profiles import get_profile, collection_config, migrate_collection, QDRANT_MIGRATE
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 # Qdrant configuration
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "pdf_chunks")
+# Per-request timeout in seconds
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))
+
+# The qdrant_client package is slow to import and the server may not be up yet,
+# so clients are created (and the collection checked) on first use
+_qdrant = None
+_qdrant_lock = threading.Lock()
+
+# Async client for the request path; reused so its HTTP connection pool is
+# shared by every search
+_async_qdrant = None
+
+
+def _payload_indexes(models) -> dict:
+    # Filtered search scans every point without these, so latency grows with the collection
+    return {
+        "doc_id": models.PayloadSchemaType.KEYWORD,
+        "page": models.PayloadSchemaType.INTEGER,
+    }
 
-# Initialize Qdrant client
-qdrant = QdrantClient(url=QDRANT_URL)
 
-# Ensure collection exists
-collections_info = qdrant.get_collections()
-existing_collections = [c.name for c in collections_info.collections] if collections_info.collections else []
+def _ensure_collection(client):
+    from qdrant_client.http import models
 
-if COLLECTION_NAME not in existing_collections:
-    qdrant.recreate_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE),
-    )
+    collections_info = client.get_collections()
+    existing_collections = [c.name for c in collections_info.collections] if collections_info.collections else []
 
-def search_qdrant_for_doc(query: str, doc_id: str, top_k: int = 3):
+    profile = get_profile()
+    if COLLECTION_NAME not in existing_collections:
+        client.recreate_collection(collection_name=COLLECTION_NAME, **collection_config(profile))
+    elif QDRANT_MIGRATE:
+        migrate_collection(client, COLLECTION_NAME, profile)
+        logger.info("Applied Qdrant profile %r to %s", profile["name"], COLLECTION_NAME)
+
+    wanted = _payload_indexes(models)
+    existing = client.get_collection(COLLECTION_NAME).payload_schema or {}
+    for field, schema in wanted.items():
+        if field not in existing:
+            client.create_payload_index(
+                collection_name=COLLECTION_NAME,
+                field_name=field,
+                field_schema=schema,
+                wait=True,
+            )
+
+    missing = set(wanted) - set(client.get_collection(COLLECTION_NAME).payload_schema or {})
+    if missing:
+        # Local (":memory:" / path) mode ignores payload indexes; a server never should
+        logger.warning("Qdrant payload indexes missing for %s: %s", COLLECTION_NAME, sorted(missing))
+
+
+def get_qdrant():
     """
-    Searches Qdrant for the top_k most similar vectors to the query within a specific document.
+    Return the shared sync Qdrant client, connecting and making sure the
+    collection exists on first use.
     """
-    if not query or not doc_id:
-        return []
-
-    query_emb = embed_text([query])[0]
-
-    flt = models.Filter(
-        must=[models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))]
-    )
-
-    results = qdrant.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_emb,
-        limit=top_k,
-        query_filter=flt
-    )
-    return results
-import os
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from .embeddings import embed_text
+    global _qdrant
+    if _qdrant is None:
+        with _qdrant_lock:
+            if _qdrant is None:
+                from qdrant_client import QdrantClient
 
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "pdf_chunks")
+                start = time.perf_counter()
+                client = QdrantClient(url=QDRANT_URL, timeout=QDRANT_TIMEOUT)
+                _ensure_collection(client)
+                metrics.stage_seconds.observe(time.perf_counter() - start, stage="qdrant_connect")
+                _qdrant = client
+    return _qdrant
+
+
+def qdrant_loaded() -> bool:
+    """True once the Qdrant connection has been established."""
+    return _qdrant is not None
+
+
+def get_async_qdrant():
+    """Return the shared async Qdrant client."""
+    global _async_qdrant
+    if _async_qdrant is None:
+        from qdrant_client import AsyncQdrantClient
+
+        _async_qdrant = AsyncQdrantClient(url=QDRANT_URL, timeout=QDRANT_TIMEOUT)
+    return _async_qdrant
+
+
+async def close_async_qdrant():
+    """Close the async client's connections (called on app shutdown)."""
+    global _async_qdrant
+    if _async_qdrant is not None:
+        await _async_qdrant.close()
+        _async_qdrant = None
+
+
+def doc_filter(doc_id):
+    """
+    Filter matching the chunks of one document (a doc_id) or several (a list
+    of doc_ids). None matches every document.
+    """
+    from qdrant_client.http import models
 
-qdrant = QdrantClient(url=QDRANT_URL)
-
-# Ensure collection exists
-collections_info = qdrant.get_collections()
-existing_collections = [c.name for c in collections_info.collections] if collections_info.collections else []
-if COLLECTION_NAME not in existing_collections:
-    qdrant.recreate_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE),
-    )
-
-def generate_embeddings_and_store(chunks_path: str, doc_id: str):
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        chunks = [line.strip() for line in f.readlines() if line.strip()]
-
-    points = []
-    for i, chunk in enumerate(chunks):
-        embedding_vector = embed_text(chunk)[0]
-        points.append({
-            "id": f"{doc_id}_{i}",
-            "vector": embedding_vector,
-            "payload": {"text": chunk, "doc_id": doc_id}
-        })
-
-    qdrant.upsert(collection_name=COLLECTION_NAME, points=points)
-
-def search_qdrant_for_doc(query: str, doc_id: str, top_k: int = 10):
-    query_emb = embed_text([query])[0]
-    flt = models.Filter(must=[models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))])
-    results = qdrant.search(collection_name=COLLECTION_NAME, query_vector=query_emb, limit=top_k, query_filter=flt)
-    return results
+    if doc_id is None:
+        return None
+    if isinstance(doc_id, str):
+        match = models.MatchValue(value=doc_id)
+    else:
+        match = models.MatchAny(any=list(doc_id))
+    return models.Filter(must=[models.FieldCondition(key="doc_id", match=match)])
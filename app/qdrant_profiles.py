@@ -0,0 +1,111 @@
+# app/qdrant_profiles.py
+#
+# Storage / index profiles for the Qdrant collection. A profile trades recall
+# for memory: quantized copies of the vectors stay in RAM for the HNSW search,
+# while the float32 originals can live on disk and are only read to rescore
+# the top candidates.
+
+import os
+
+from .embeddings import EMBED_DIM
+
+# --- Configuration ---
+# Profile applied when the collection is created (see PROFILES)
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "default")
+# Apply the profile to an existing collection at startup (rebuilds its index in the background)
+QDRANT_MIGRATE = os.getenv("QDRANT_MIGRATE", "0") == "1"
+
+# quantization: None, "scalar" (int8, 4x smaller) or "binary" (1 bit, 32x smaller)
+# on_disk: keep the float32 originals on disk instead of in RAM
+# m / ef_construct: HNSW graph degree and build-time beam width
+# ef: search-time beam width (None = Qdrant's default)
+# oversampling: candidates fetched per result from the quantized index before rescoring
+PROFILES = {
+    "default": {"quantization": None, "on_disk": False, "m": 16, "ef_construct": 100, "ef": None, "oversampling": None},
+    "scalar": {"quantization": "scalar", "on_disk": False, "m": 16, "ef_construct": 100, "ef": 128, "oversampling": 1.5},
+    "scalar_on_disk": {"quantization": "scalar", "on_disk": True, "m": 16, "ef_construct": 100, "ef": 128, "oversampling": 2.0},
+    "binary_on_disk": {"quantization": "binary", "on_disk": True, "m": 16, "ef_construct": 100, "ef": 128, "oversampling": 3.0},
+    "compact": {"quantization": "scalar", "on_disk": True, "m": 8, "ef_construct": 64, "ef": 96, "oversampling": 2.0},
+}
+
+
+def get_profile(name: str = None) -> dict:
+    """
+    Return a profile by name (QDRANT_PROFILE by default), with any
+    QDRANT_HNSW_M / QDRANT_HNSW_EF_CONSTRUCT / QDRANT_SEARCH_EF overrides applied.
+    """
+    name = name or QDRANT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown QDRANT_PROFILE: {name!r} (choose from {', '.join(PROFILES)})")
+    profile = dict(PROFILES[name], name=name)
+    for key, env in (("m", "QDRANT_HNSW_M"), ("ef_construct", "QDRANT_HNSW_EF_CONSTRUCT"), ("ef", "QDRANT_SEARCH_EF")):
+        if os.getenv(env):
+            profile[key] = int(os.getenv(env))
+    return profile
+
+
+def _quantization_config(models, profile: dict):
+    if profile["quantization"] == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if profile["quantization"] == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def collection_config(profile: dict) -> dict:
+    """Keyword arguments for `create_collection` / `recreate_collection`."""
+    from qdrant_client.http import models
+
+    return {
+        "vectors_config": models.VectorParams(
+            size=EMBED_DIM, distance=models.Distance.COSINE, on_disk=profile["on_disk"]
+        ),
+        "hnsw_config": models.HnswConfigDiff(m=profile["m"], ef_construct=profile["ef_construct"]),
+        "quantization_config": _quantization_config(models, profile),
+    }
+
+
+def search_params(profile: dict):
+    """SearchParams for queries against a collection built with `profile` (None = server defaults)."""
+    from qdrant_client.http import models
+
+    if profile["ef"] is None and profile["quantization"] is None:
+        return None
+    quantization = None
+    if profile["quantization"] is not None:
+        quantization = models.QuantizationSearchParams(rescore=True, oversampling=profile["oversampling"])
+    return models.SearchParams(hnsw_ef=profile["ef"], quantization=quantization)
+
+
+def migrate_collection(client, collection_name: str, profile: dict):
+    """
+    Apply a profile to an existing collection in place. Qdrant rebuilds the
+    quantized vectors and HNSW graph in the background; the collection stays
+    searchable while it does.
+    """
+    from qdrant_client.http import models
+
+    quantization = _quantization_config(models, profile)
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": models.VectorParamsDiff(on_disk=profile["on_disk"])},
+        hnsw_config=models.HnswConfigDiff(m=profile["m"], ef_construct=profile["ef_construct"]),
+        quantization_config=quantization if quantization is not None else models.Disabled.DISABLED,
+    )
+
+
+def estimate_ram_bytes(points: int, profile: dict, dim: int = EMBED_DIM) -> int:
+    """
+    Rough resident memory of a collection's vectors and HNSW graph under
+    `profile` (payloads and on-disk data excluded).
+    """
+    vectors = 0 if profile["on_disk"] else points * dim * 4
+    if profile["quantization"] == "scalar":
+        vectors += points * dim
+    elif profile["quantization"] == "binary":
+        vectors += points * dim // 8
+    # Layer 0 holds 2*m links per point, 4 bytes each; upper layers add ~1/m of that
+    graph = points * 2 * profile["m"] * 4 * (1 + 1 / profile["m"])
+    return int(vectors + graph)
@@ -0,0 +1,76 @@
+# app/reranker.py
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Rerank retrieved candidates with a cross-encoder before building the prompt
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched from retrieval for the reranker to choose from
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "40"))
+# (query, chunk) pairs scored per model call
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+
+# The ONNX model is loaded on first use (or by the startup warmup), not at import
+_reranker = None
+_reranker_lock = threading.Lock()
+
+# Scoring is CPU-bound and ONNX Runtime already uses every core per call, so
+# requests take turns on one thread instead of contending with each other
+_rerank_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+
+def get_reranker():
+    """Return the shared FastEmbed cross-encoder, loading it on first use."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                from fastembed.rerank.cross_encoder import TextCrossEncoder
+                _reranker = TextCrossEncoder(RERANK_MODEL)
+    return _reranker
+
+
+def reranker_loaded() -> bool:
+    """True once the reranking model has been loaded."""
+    return _reranker is not None
+
+
+def rerank(query: str, hits: list, top_k: int) -> tuple[list, float]:
+    """
+    Score each hit's text against the query and keep the best `top_k`.
+
+    Args:
+        query: The user's question.
+        hits: Retrieval hits with a `payload["text"]`.
+        top_k: Number of hits to keep.
+
+    Returns:
+        tuple: (hits in reranked order, seconds spent scoring)
+    """
+    hits = [h for h in hits if h.payload.get("text")]
+    if len(hits) <= 1:
+        return hits[:top_k], 0.0
+
+    start = time.perf_counter()
+    scores = list(get_reranker().rerank(
+        query, [h.payload["text"] for h in hits], batch_size=RERANK_BATCH_SIZE
+    ))
+    elapsed = time.perf_counter() - start
+
+    order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)[:top_k]
+    logger.info("Reranked %d candidates in %.1f ms", len(hits), elapsed * 1000)
+    return [hits[i] for i in order], elapsed
+
+
+async def rerank_async(query: str, hits: list, top_k: int) -> tuple[list, float]:
+    """Run `rerank` on the reranker thread so the event loop stays free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_rerank_executor, rerank, query, hits, top_k)
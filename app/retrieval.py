@@ -0,0 +1,133 @@
+# app/retrieval.py
+
+import os
+import asyncio
+import logging
+
+from . import lexical_index
+from . import reranker
+from . import metrics
+from .vector_store import search_qdrant_for_doc_async, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Fuse BM25 and vector candidates (0 = vector search only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Reciprocal rank fusion constant
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Chunks passed on to the prompt
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+
+
+class FusedHit:
+    """
+    Retrieval result with the ScoredPoint-style `id` / `score` / `payload`
+    attributes, plus the score each retriever gave it (None if it missed).
+    """
+
+    __slots__ = ("id", "score", "payload", "vector_score", "lexical_score")
+
+    def __init__(self, id, score: float, payload: dict, vector_score: float = None, lexical_score: float = None):
+        self.id = id
+        self.score = score
+        self.payload = payload
+        self.vector_score = vector_score
+        self.lexical_score = lexical_score
+
+
+def _chunk_key(payload: dict):
+    # Chunks stored before chunk_index existed are matched by their text
+    return payload.get("doc_id"), payload.get("chunk_index", payload.get("text"))
+
+
+def reciprocal_rank_fusion(vector_hits, lexical_hits, top_k: int, k: int = RRF_K) -> list[FusedHit]:
+    """
+    Merge vector hits (ScoredPoint-like) and lexical hits ((score, payload)
+    pairs) by summing 1 / (k + rank) over the lists each chunk appears in.
+    """
+    fused = {}
+    for rank, hit in enumerate(vector_hits):
+        key = _chunk_key(hit.payload)
+        fused[key] = FusedHit(hit.id, 1.0 / (k + rank + 1), hit.payload, vector_score=hit.score)
+
+    for rank, (score, payload) in enumerate(lexical_hits):
+        key = _chunk_key(payload)
+        hit = fused.get(key)
+        if hit is None:
+            fused[key] = FusedHit(key, 1.0 / (k + rank + 1), payload, lexical_score=score)
+        else:
+            hit.score += 1.0 / (k + rank + 1)
+            hit.lexical_score = score
+
+    return sorted(fused.values(), key=lambda h: h.score, reverse=True)[:top_k]
+
+
+def _candidates(top_k: int) -> int:
+    # With reranking on, fetch a wider pool for the cross-encoder to choose from
+    return max(top_k, reranker.RERANK_CANDIDATES) if reranker.RERANK else top_k
+
+
+async def _rerank(query: str, hits: list, top_k: int) -> list:
+    if reranker.RERANK and hits:
+        try:
+            hits, seconds = await reranker.rerank_async(query, hits, top_k)
+            metrics.record("rerank", seconds)
+        except Exception as e:
+            # A missing model shouldn't take answering down; fall back to retrieval order
+            logger.warning("Reranking failed, using retrieval order: %s", e)
+    return hits[:top_k]
+
+
+async def retrieve(query: str, doc_id, top_k: int = RETRIEVAL_TOP_K, query_vector=None) -> list:
+    """
+    Retrieve the chunks of a document (or of a list of documents, searched
+    together) that best match a question.
+
+    With HYBRID_SEARCH on, vector and BM25 candidates are fetched concurrently
+    and fused, so exact-term matches surface without raising `top_k`. With
+    RERANK on, RERANK_CANDIDATES are fetched and a cross-encoder picks the
+    best `top_k` of them.
+    """
+    candidates = _candidates(top_k)
+
+    if not HYBRID_SEARCH:
+        hits = await search_qdrant_for_doc_async(query, doc_id, top_k=candidates, query_vector=query_vector)
+    else:
+        per_retriever = max(HYBRID_CANDIDATES, candidates)
+        vector_hits, lexical_hits = await asyncio.gather(
+            search_qdrant_for_doc_async(query, doc_id, top_k=per_retriever, query_vector=query_vector),
+            asyncio.to_thread(lexical_index.search, doc_id, query, per_retriever),
+        )
+        hits = reciprocal_rank_fusion(vector_hits or [], lexical_hits, candidates)
+
+    return await _rerank(query, hits, top_k)
+
+
+async def _timed_search_batch(doc_id, query_vectors: list, top_k: int) -> list[list]:
+    with metrics.timed("vector_search"):
+        return await get_vector_store().search_batch_async(doc_id, query_vectors, top_k)
+
+
+async def retrieve_batch(queries: list[str], doc_id, query_vectors: list, top_k: int = RETRIEVAL_TOP_K) -> list[list]:
+    """
+    `retrieve` for many questions against the same document(s): all vector
+    searches go to the store as one batched request.
+    """
+    candidates = _candidates(top_k)
+    per_retriever = max(HYBRID_CANDIDATES, candidates) if HYBRID_SEARCH else candidates
+
+    if HYBRID_SEARCH:
+        vector_hits, lexical_hits = await asyncio.gather(
+            _timed_search_batch(doc_id, query_vectors, per_retriever),
+            asyncio.to_thread(lambda: [lexical_index.search(doc_id, q, per_retriever) for q in queries]),
+        )
+        fused = [
+            reciprocal_rank_fusion(v or [], l, candidates) for v, l in zip(vector_hits, lexical_hits)
+        ]
+    else:
+        fused = await _timed_search_batch(doc_id, query_vectors, candidates)
+
+    return list(await asyncio.gather(*(_rerank(q, hits, top_k) for q, hits in zip(queries, fused))))
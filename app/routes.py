@@ -1,17 +1,24 @@
-from fastapi import APIRouter, Request, UploadFile, Body
+from fastapi import APIRouter, Request, UploadFile, Body, Query
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
 import os
+import time
 import asyncio
 import uuid
 import json
 import traceback
-import pdfplumber
 
 # Use relative imports within the 'app' package
-from .state import uploaded_docs, chat_history
-from .utils import extract_text_from_pdf, chunk_text, generate_embeddings_and_store
-from .qdrant_client import search_qdrant_for_doc
+from .state import uploaded_docs, doc_hashes, append_chat_turn, get_chat_history
+from .jobs import submit_ingestion, get_job, find_job_for_doc
+from .uploads import save_upload, UploadTooLarge
+from .vector_store import get_vector_store
+from .retrieval import retrieve, retrieve_batch
+from .context import build_context
+from .embeddings import embed_text, embed_query, embedder_loaded
+from . import reranker
+from . import answer_cache
+from . import metrics
 from .genai_client import answer_with_groq_async
 
 router = APIRouter()
@@ -21,6 +28,19 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "../templates"))
 UPLOAD_DIR = os.path.join(BASE_DIR, "../uploaded_pdfs")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Default and maximum number of chat turns per history page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_PAGE_MAX = 100
+# Questions accepted by one /ask/batch/ request
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "50"))
+# LLM calls in flight per /ask/batch/ request
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+# Largest top_k accepted by /search/
+SEARCH_TOP_K_MAX = 50
+# Streamed answer text is sent in groups of at least this many characters...
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "24"))
+# ...or after this many milliseconds, whichever comes first
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "25"))
 
 
 # --- Routes ---
@@ -28,11 +48,45 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 @router.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """Serve main page"""
+    # Documents from earlier sessions come straight from the state database
+    documents = {doc_id: doc["filename"] for doc_id, doc in uploaded_docs.items() if doc.get("status") == "ready"}
     return templates.TemplateResponse(
         "index.html",
-        {"request": request, "uploaded_docs": uploaded_docs}
+        {"request": request, "uploaded_docs": uploaded_docs, "documents": documents}
     )
 
+def _resolve_duplicate(content_hash: str):
+    """
+    Look up a previous upload with the same content hash.
+
+    Returns the upload response for the canonical document, or None if the
+    bytes have not been seen (or their earlier ingestion failed).
+    """
+    doc_id = doc_hashes.get(content_hash)
+    if doc_id is None:
+        return None
+    doc = uploaded_docs.get(doc_id)
+    if doc is not None and doc.get("status") == "ready":
+        return {"id": doc_id, "filename": doc["filename"], "status": "done", "duplicate": True}
+    job = find_job_for_doc(doc_id)
+    if job is None or job["status"] == "failed":
+        return None
+    return {"job_id": job["id"], "id": doc_id, "filename": job["filename"], "status": job["status"], "duplicate": True}
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint (counters and histograms of this worker process)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/ready")
+async def readiness():
+    """Report which heavy components are loaded; 503 until the app can serve questions."""
+    components = {"embedder": embedder_loaded(), "vector_store": get_vector_store().loaded()}
+    if reranker.RERANK:
+        components["reranker"] = reranker.reranker_loaded()
+    ready = all(components.values())
+    return JSONResponse({"ready": ready, "components": components}, status_code=200 if ready else 503)
+
 @router.post("/upload/")
 async def upload_pdf(file: UploadFile = None):
     if not file:
@@ -41,69 +95,260 @@ async def upload_pdf(file: UploadFile = None):
         filename = file.filename
         doc_id = str(uuid.uuid4())
         saved_path = os.path.join(UPLOAD_DIR, f"{doc_id}_{filename}")
-        
-        with open(saved_path, "wb") as f:
-            f.write(await file.read())
 
-        full_text = extract_text_from_pdf(saved_path)
-        text_chunks = chunk_text(full_text)
-        num_chunks = len(text_chunks)
-        generate_embeddings_and_store(text_chunks, doc_id)
+        # Streamed to disk in chunks; hash and size come out of the same pass
+        try:
+            content_hash, size = await save_upload(file, saved_path)
+        except UploadTooLarge as e:
+            return JSONResponse({"error": str(e)}, status_code=413)
+
+        # Identical bytes were already ingested (or are being ingested): reuse that document
+        duplicate = _resolve_duplicate(content_hash)
+        if duplicate is not None:
+            os.remove(saved_path)
+            return JSONResponse(duplicate)
 
-        # Modify the shared state
-        uploaded_docs[doc_id] = {"filename": filename, "path": saved_path}
-        chat_history[doc_id] = []
+        # Extraction, chunking and embedding run on the ingestion worker pool
+        job = submit_ingestion(saved_path, doc_id, filename, content_hash, size)
 
-        return JSONResponse({"id": doc_id, "filename": filename, "chunks": num_chunks})
+        return JSONResponse(
+            {"job_id": job["id"], "id": doc_id, "filename": filename, "status": job["status"]},
+            status_code=202,
+        )
     except Exception as e:
         traceback.print_exc()
         return JSONResponse({"error": f"Error processing file: {e}"}, status_code=500)
 
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job)
+
+def _build_prompt(query: str, context_chunks: list[dict], label_sources: bool = False) -> str:
+    if label_sources:
+        # Across documents, tell the model where each passage is from so it can cite it
+        prompt_chunks = [
+            f"[{uploaded_docs[c['doc_id']]['filename']}, page {c['page']}]\n{c['text']}" for c in context_chunks
+        ]
+    else:
+        prompt_chunks = [c["text"] for c in context_chunks]
+    if not prompt_chunks:
+        return query
+    context_text = "\n\n".join(prompt_chunks)
+    return (
+        f"Use the following context from a PDF to answer the question.\n\n"
+        f"Context:\n{context_text}\n\n"
+        f"Question: {query}\n"
+        f"Answer based only on the context provided. If the answer is not present, respond 'Not available in the document.'"
+    )
+
+def _answer_metadata(doc_id: str, context_chunks: list[dict]) -> dict:
+    # ✅ FIXED: Only include relevant pages
+    return {
+        "filename": uploaded_docs[doc_id]["filename"],
+        "pages": sorted({page for c in context_chunks for page in c.get("pages", [c["page"]]) if page is not None})
+    }
+
+def _citations(context_chunks: list[dict]) -> list[dict]:
+    """Group the pages used as context by document, in order of first use."""
+    documents = {}
+    for c in context_chunks:
+        doc = documents.setdefault(c["doc_id"], set())
+        doc.update(page for page in c.get("pages", [c["page"]]) if page is not None)
+    return [
+        {"doc_id": doc_id, "filename": uploaded_docs[doc_id]["filename"], "pages": sorted(pages)}
+        for doc_id, pages in documents.items()
+    ]
+
+def _resolve_doc_ids(doc_ids):
+    """
+    Turn a request's `doc_ids` (a list, or "all" for every ready document)
+    into a list of known document ids.
+
+    Returns:
+        tuple: (doc_ids, error JSONResponse or None)
+    """
+    if doc_ids == "all":
+        doc_ids = [doc_id for doc_id, doc in uploaded_docs.items() if doc.get("status") == "ready"]
+        if not doc_ids:
+            return None, JSONResponse({"error": "No documents available"}, status_code=404)
+        return doc_ids, None
+    if not isinstance(doc_ids, list) or not doc_ids or not all(isinstance(d, str) for d in doc_ids):
+        return None, JSONResponse({"error": 'doc_ids must be a non-empty list of ids or "all"'}, status_code=400)
+    missing = [doc_id for doc_id in doc_ids if doc_id not in uploaded_docs]
+    if missing:
+        return None, JSONResponse({"error": f"Documents not found: {', '.join(missing)}"}, status_code=404)
+    return list(dict.fromkeys(doc_ids)), None
+
+async def _lookup_cached_answer(doc_id: str, query: str):
+    """
+    Check the answer cache, embedding the question only if there is no exact match.
+
+    Returns:
+        tuple: (cached entry or None, query embedding or None)
+    """
+    cached = answer_cache.get_exact(doc_id, query)
+    if cached is not None:
+        metrics.answer_cache_total.inc(result="exact")
+        return cached, None
+    query_emb = await embed_query(query)
+    cached = answer_cache.get_similar(doc_id, query_emb)
+    metrics.answer_cache_total.inc(result="similar" if cached is not None else "miss")
+    return cached, query_emb
+
+def _cache_answer(doc_id: str, query: str, query_emb, answer: str, context_chunks: list[dict], metadata: dict):
+    """
+    Store an answer in the answer cache, unless the document is still being
+    ingested: answers built from its first batches would go stale.
+    """
+    doc = uploaded_docs.get(doc_id)
+    if doc is not None and doc.get("status") == "ready":
+        answer_cache.store(doc_id, query, query_emb, answer, context_chunks, metadata)
+
+def _compact_sources(context_chunks: list[dict], snippet_chars: int = 200) -> list[dict]:
+    """Trim source chunks to page + short snippet before they go into the chat history."""
+    return [{"page": c["page"], "snippet": c["text"][:snippet_chars]} for c in context_chunks]
+
+def _replay_pieces(text: str, size: int = 64):
+    """Split a cached answer into stream-sized pieces on word boundaries."""
+    piece = []
+    length = 0
+    for word in text.split(" "):
+        piece.append(word)
+        length += len(word) + 1
+        if length >= size:
+            yield " ".join(piece) + " "
+            piece, length = [], 0
+    if piece:
+        yield " ".join(piece)
+
+async def _ask_documents(query: str, doc_ids):
+    """Answer from several documents at once; the answer cache and chat history are per document, so both are skipped."""
+    doc_ids, error = _resolve_doc_ids(doc_ids)
+    if error is not None:
+        return error
+
+    try:
+        results = await retrieve(query, doc_ids) or []
+        with metrics.timed("prompt"):
+            context_chunks = build_context(results)
+            prompt = _build_prompt(query, context_chunks, label_sources=True)
+        answer = await answer_with_groq_async(prompt)
+        return JSONResponse({
+            "query": query, "answer": answer, "doc_ids": doc_ids,
+            "context": context_chunks, "metadata": {"documents": _citations(context_chunks)},
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({"error": f"Error generating answer: {e}"}, status_code=500)
+
 @router.post("/ask/")
 async def ask_question(payload: dict = Body(...)):
+    """
+    Answer a question about one document ("doc_id"), or about several at
+    once ("doc_ids": a list of ids or "all").
+    """
     query = payload.get("question")
     doc_id = payload.get("doc_id")
 
+    if query and payload.get("doc_ids") is not None:
+        return await _ask_documents(query, payload["doc_ids"])
+
     if not query or not doc_id:
         return JSONResponse({"error": "Missing question or doc_id"}, status_code=400)
     if doc_id not in uploaded_docs:
         return JSONResponse({"error": "Selected document not found"}, status_code=404)
 
     try:
-        results = search_qdrant_for_doc(query, doc_id, top_k=10) or []
-        context_chunks = [
-            {"text": r.payload.get("text", ""), "page": r.payload.get("page", None)}
-            for r in results if r.payload.get("text")
-        ]
-        prompt_chunks = [c["text"] for c in context_chunks]
+        cached, query_emb = await _lookup_cached_answer(doc_id, query)
+        if cached is not None:
+            answer, context_chunks, metadata = cached["answer"], cached["context"], cached["metadata"]
+        else:
+            results = await retrieve(query, doc_id, query_vector=query_emb) or []
+            with metrics.timed("prompt"):
+                context_chunks = build_context(results)
+                prompt = _build_prompt(query, context_chunks)
 
-        prompt = (
-            f"Use the following context from a PDF to answer the question.\n\n"
-            f"Context:\n{'\n\n'.join(prompt_chunks)}\n\n"
-            f"Question: {query}\n"
-            f"Answer based only on the context provided. If the answer is not present, respond 'Not available in the document.'"
-        ) if prompt_chunks else query
+            answer = await answer_with_groq_async(prompt)
+            metadata = _answer_metadata(doc_id, context_chunks)
+            _cache_answer(doc_id, query, query_emb, answer, context_chunks, metadata)
 
-        answer = await answer_with_groq_async(prompt)
-        chat_history.setdefault(doc_id, []).append({"question": query, "answer": answer})
+        turn = append_chat_turn(doc_id, {"question": query, "answer": answer})
 
-        # ✅ FIXED: Only include relevant pages
-        metadata = {
-            "filename": uploaded_docs[doc_id]["filename"],
-            "pages": sorted(list(set([c["page"] for c in context_chunks if c["page"] is not None])))
+        response = {
+            "query": query, "answer": answer, "doc_id": doc_id, "turn": turn,
+            "context": context_chunks, "metadata": metadata,
+            "cached": cached is not None
         }
-
-        return JSONResponse({
-            "query": query, "answer": answer, "doc_id": doc_id,
-            "history": chat_history.get(doc_id, []),
-            "context": context_chunks, "metadata": metadata
-        })
+        # Older turns are served by /history/{doc_id}; send a page only when asked
+        if payload.get("include_history"):
+            response["history"] = get_chat_history(doc_id, limit=HISTORY_PAGE_SIZE)
+        return JSONResponse(response)
     except Exception as e:
         traceback.print_exc()
         return JSONResponse({"error": f"Error generating answer: {e}"}, status_code=500)
 
+def _sse(event: str, data: dict) -> str:
+    """Frame one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _coalesce(pieces, min_chars: int = STREAM_FLUSH_CHARS, max_wait_ms: float = STREAM_FLUSH_MS):
+    """
+    Group token pieces into fewer, larger writes: a group is flushed once it
+    holds `min_chars` or `max_wait_ms` has passed since the last flush, even
+    if no further piece arrives. The first piece goes out immediately.
+    """
+    buffer, size, last_flush = [], 0, 0.0
+    next_piece = None
+    try:
+        while True:
+            if next_piece is None:
+                next_piece = asyncio.ensure_future(pieces.__anext__())
+            timeout = None
+            if buffer:
+                timeout = max(0.0, max_wait_ms / 1000 - (time.perf_counter() - last_flush))
+            # asyncio.wait, not wait_for: a timeout must not cancel the pending read
+            done, _ = await asyncio.wait({next_piece}, timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer, size, last_flush = [], 0, time.perf_counter()
+                continue
+
+            read, next_piece = next_piece, None
+            try:
+                piece = read.result()
+            except StopAsyncIteration:
+                break
+            buffer.append(piece)
+            size += len(piece)
+            now = time.perf_counter()
+            if size >= min_chars or (now - last_flush) * 1000 >= max_wait_ms:
+                yield "".join(buffer)
+                buffer, size, last_flush = [], 0, now
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if next_piece is not None:
+            next_piece.cancel()
+            try:
+                await next_piece
+            except (asyncio.CancelledError, Exception):
+                pass
+        # Closing the upstream generator closes the Groq stream (e.g. on client disconnect)
+        await pieces.aclose()
+
 @router.post("/ask/stream/")
 async def ask_question_stream(payload: dict = Body(...)):
+    """
+    Stream an answer as server-sent events:
+
+    - `sources`: {"metadata", "sources", "cached"}, sent before the first token
+    - `token`: {"text"}, answer text in order
+    - `done`: {"metadata", "cached"}
+    - `error`: {"message"}
+    """
     query = payload.get("question")
     doc_id = payload.get("doc_id")
 
@@ -112,47 +357,181 @@ async def ask_question_stream(payload: dict = Body(...)):
     if doc_id not in uploaded_docs:
         return JSONResponse({"error": "Selected document not found"}, status_code=404)
 
-    results = search_qdrant_for_doc(query, doc_id, top_k=10) or []
-    context_chunks = [
-        {"text": r.payload.get("text", ""), "page": r.payload.get("page", None)}
-        for r in results if r.payload.get("text")
-    ]
-    prompt_chunks = [c["text"] for c in context_chunks]
-    prompt = (
-        f"Use the following context from a PDF to answer the question.\n\n"
-        f"Context:\n{'\n\n'.join(prompt_chunks)}\n\n"
-        f"Question: {query}\n"
-        f"Answer based only on the context provided. If the answer is not present, respond 'Not available in the document.'"
-    ) if prompt_chunks else query
-
-    async def answer_generator():
+    async def event_stream():
+        # Retrieval runs inside the stream, so the response starts right away
         try:
-            # ✅ FIXED: Only include relevant pages
-            metadata = {
-                "filename": uploaded_docs[doc_id]["filename"],
-                "pages": sorted(list(set([c["page"] for c in context_chunks if c["page"] is not None])))
-            }
+            cached, query_emb = await _lookup_cached_answer(doc_id, query)
+            if cached is not None:
+                sources = _compact_sources(cached["context"])
+                yield _sse("sources", {"metadata": cached["metadata"], "sources": sources, "cached": True})
+                for piece in _replay_pieces(cached["answer"]):
+                    yield _sse("token", {"text": piece})
+                yield _sse("done", {"metadata": cached["metadata"], "cached": True})
+                append_chat_turn(doc_id, {"question": query, "answer": cached["answer"], "sources": sources})
+                return
+
+            results = await retrieve(query, doc_id, query_vector=query_emb) or []
+            with metrics.timed("prompt"):
+                context_chunks = build_context(results)
+                prompt = _build_prompt(query, context_chunks)
+            metadata = _answer_metadata(doc_id, context_chunks)
+            sources = _compact_sources(context_chunks)
+            yield _sse("sources", {"metadata": metadata, "sources": sources, "cached": False})
 
-            full_answer = ""
-            async for chunk in await answer_with_groq_async(prompt, stream=True):
-                full_answer += chunk
-                yield chunk
-                await asyncio.sleep(0.01)
+            parts = []
+            async for text in _coalesce(await answer_with_groq_async(prompt, stream=True)):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+            full_answer = "".join(parts)
 
             if not full_answer.strip():
-                final_text = "⚠️ No relevant content found." if not context_chunks else "⚠️ Unable to generate answer from the context."
-                yield final_text
-                full_answer = final_text
+                full_answer = "⚠️ No relevant content found." if not context_chunks else "⚠️ Unable to generate answer from the context."
+                yield _sse("token", {"text": full_answer})
+            else:
+                _cache_answer(doc_id, query, query_emb, full_answer, context_chunks, metadata)
 
-            yield f"[META]{json.dumps(metadata)}"
+            yield _sse("done", {"metadata": metadata, "cached": False})
+            append_chat_turn(doc_id, {"question": query, "answer": full_answer, "sources": sources})
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse("error", {"message": f"Error generating answer: {e}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering or caching the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/ask/batch/")
+async def ask_batch(payload: dict = Body(...)):
+    """
+    Answer many questions about one document. Questions are embedded in one
+    call and searched in one batched request, then answered concurrently
+    (ASK_BATCH_CONCURRENCY at a time). Answers stream back as NDJSON lines,
+    {"index", "question", "answer", "metadata", "cached"}, as they complete.
+    """
+    questions = payload.get("questions")
+    doc_id = payload.get("doc_id")
 
-            chat_history.setdefault(doc_id, []).append({
-                "question": query,
-                "answer": full_answer,
-                "sources": context_chunks
-            })
+    if not doc_id or not isinstance(questions, list) or not questions:
+        return JSONResponse({"error": "Missing questions or doc_id"}, status_code=400)
+    if len(questions) > ASK_BATCH_MAX or not all(isinstance(q, str) and q.strip() for q in questions):
+        return JSONResponse(
+            {"error": f"questions must be 1-{ASK_BATCH_MAX} non-empty strings"}, status_code=400
+        )
+    if doc_id not in uploaded_docs:
+        return JSONResponse({"error": "Selected document not found"}, status_code=404)
+
+    try:
+        # Exact cache hits skip embedding; similar ones skip retrieval and the LLM
+        cached = {i: answer_cache.get_exact(doc_id, q) for i, q in enumerate(questions)}
+        metrics.answer_cache_total.inc(sum(entry is not None for entry in cached.values()), result="exact")
+        to_embed = [i for i, entry in cached.items() if entry is None]
+        vectors = {}
+        if to_embed:
+            embedded = await asyncio.to_thread(embed_text, [questions[i] for i in to_embed])
+            for i, vector in zip(to_embed, embedded):
+                vectors[i] = vector
+                cached[i] = answer_cache.get_similar(doc_id, vector)
+                metrics.answer_cache_total.inc(result="similar" if cached[i] is not None else "miss")
+
+        to_answer = [i for i, entry in cached.items() if entry is None]
+        results = []
+        if to_answer:
+            results = await retrieve_batch(
+                [questions[i] for i in to_answer], doc_id, [vectors[i] for i in to_answer]
+            )
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({"error": f"Error generating answer: {e}"}, status_code=500)
+
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+
+    async def answer_one(i: int, hits) -> dict:
+        query = questions[i]
+        try:
+            with metrics.timed("prompt"):
+                context_chunks = build_context(hits or [])
+                prompt = _build_prompt(query, context_chunks)
+            async with semaphore:
+                answer = await answer_with_groq_async(prompt)
+            metadata = _answer_metadata(doc_id, context_chunks)
+            _cache_answer(doc_id, query, vectors[i], answer, context_chunks, metadata)
+            append_chat_turn(doc_id, {"question": query, "answer": answer})
+            return {"index": i, "question": query, "answer": answer, "metadata": metadata, "cached": False}
         except Exception as e:
             traceback.print_exc()
-            yield f"⚠️ Error: {e}"
+            return {"index": i, "question": query, "error": f"Error generating answer: {e}"}
+
+    async def batch_generator():
+        for i, entry in cached.items():
+            if entry is not None:
+                append_chat_turn(doc_id, {"question": questions[i], "answer": entry["answer"]})
+                yield json.dumps({
+                    "index": i, "question": questions[i], "answer": entry["answer"],
+                    "metadata": entry["metadata"], "cached": True,
+                }) + "\n"
+
+        tasks = [asyncio.ensure_future(answer_one(i, hits)) for i, hits in zip(to_answer, results)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: don't keep spending LLM calls on it
+            for task in tasks:
+                task.cancel()
 
-    return StreamingResponse(answer_generator(), media_type="text/event-stream")
+    return StreamingResponse(batch_generator(), media_type="application/x-ndjson")
+
+@router.post("/search/")
+async def search_documents(payload: dict = Body(...)):
+    """
+    Retrieve the passages that best match a question across documents
+    ("doc_ids": a list of ids or "all"), without generating an answer.
+    """
+    query = payload.get("question")
+    if not query:
+        return JSONResponse({"error": "Missing question"}, status_code=400)
+    doc_ids, error = _resolve_doc_ids(payload.get("doc_ids", "all"))
+    if error is not None:
+        return error
+
+    top_k = payload.get("top_k", 10)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= SEARCH_TOP_K_MAX:
+        return JSONResponse({"error": f"top_k must be an integer from 1 to {SEARCH_TOP_K_MAX}"}, status_code=400)
+    try:
+        results = await retrieve(query, doc_ids, top_k=top_k) or []
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({"error": f"Error searching documents: {e}"}, status_code=500)
+    return JSONResponse({
+        "query": query,
+        "results": [
+            {
+                "doc_id": r.payload.get("doc_id"),
+                "filename": uploaded_docs[r.payload["doc_id"]]["filename"] if r.payload.get("doc_id") in uploaded_docs else None,
+                "page": r.payload.get("page"),
+                "page_end": r.payload.get("page_end", r.payload.get("page")),
+                "score": r.score,
+                "text": r.payload.get("text", ""),
+            }
+            for r in results
+        ],
+    })
+
+@router.get("/history/{doc_id}")
+async def chat_history_page(
+    doc_id: str,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX),
+    before: int = None,
+):
+    """
+    Page backwards through a document's chat history. Turns come back oldest
+    first; pass `next_before` as `before` to fetch the previous page.
+    """
+    if doc_id not in uploaded_docs:
+        return JSONResponse({"error": "Selected document not found"}, status_code=404)
+    turns = get_chat_history(doc_id, limit=limit, before=before)
+    next_before = turns[0]["id"] if len(turns) == limit else None
+    return JSONResponse({"doc_id": doc_id, "turns": turns, "next_before": next_before})
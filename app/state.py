@@ -1,7 +1,214 @@
-# This file will hold the application's in-memory state.
+# This file holds the application's state.
+#
+# Everything lives in a SQLite database in WAL mode, so document registrations,
+# chat history and ingestion jobs survive restarts and are shared by every
+# uvicorn worker process. Reads go through a short in-process cache.
 
-# In-memory storage for uploaded document metadata
-uploaded_docs = {}
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections.abc import MutableMapping
 
-# In-memory storage for conversation history per document
-chat_history = {}
\ No newline at end of file
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DB = os.getenv("STATE_DB", os.path.join(BASE_DIR, "../state.db"))
+# Seconds a cached read may be served before going back to the database
+STATE_CACHE_TTL = float(os.getenv("STATE_CACHE_TTL", "2"))
+# Chat turns kept per document; older turns are evicted (0 = unlimited)
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "200"))
+# Days a chat turn is kept (0 = forever)
+HISTORY_MAX_AGE_DAYS = float(os.getenv("HISTORY_MAX_AGE_DAYS", "0"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS chat_turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    turn TEXT NOT NULL,
+    created_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS chat_turns_doc ON chat_turns (doc_id, id);
+"""
+
+# sqlite3 connections can't be shared between threads; keep one per thread and path
+_local = threading.local()
+_schema_lock = threading.Lock()
+# Paths whose schema has been applied by this process
+_schema_ready = set()
+
+
+def open_wal_connection(path: str, schema: str, migrate=None) -> sqlite3.Connection:
+    """
+    Return this thread's connection to the SQLite database at `path`, opening it
+    in WAL mode on first use. `schema` (and `migrate(conn)`, if given) run once
+    per process.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if path not in _schema_ready:
+            with _schema_lock:
+                if path not in _schema_ready:
+                    conn.executescript(schema)
+                    if migrate is not None:
+                        migrate(conn)
+                    _schema_ready.add(path)
+        conns[path] = conn
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    # Databases created before chat turns were timestamped
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_turns)")]
+    if "created_at" not in columns:
+        conn.execute("ALTER TABLE chat_turns ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+
+
+def _conn() -> sqlite3.Connection:
+    return open_wal_connection(STATE_DB, _SCHEMA, _migrate)
+
+
+class PersistentMapping(MutableMapping):
+    """
+    dict-like view over one namespace of the state database. Values are
+    JSON-serializable; every read returns a fresh copy.
+    """
+
+    def __init__(self, namespace: str, cache_ttl: float = STATE_CACHE_TTL):
+        self.namespace = namespace
+        self.cache_ttl = cache_ttl
+        # key -> (expires_at, raw JSON); only hits are cached, so new keys written
+        # by another worker are visible immediately
+        self._cache = {}
+
+    def _get_raw(self, key):
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        row = _conn().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            self._cache.pop(key, None)
+            return None
+        self._cache[key] = (time.monotonic() + self.cache_ttl, row[0])
+        return row[0]
+
+    def __getitem__(self, key):
+        raw = self._get_raw(key)
+        if raw is None:
+            raise KeyError(key)
+        return json.loads(raw)
+
+    def __contains__(self, key):
+        return self._get_raw(key) is not None
+
+    def __setitem__(self, key, value):
+        raw = json.dumps(value)
+        _conn().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)", (self.namespace, key, raw)
+        )
+        self._cache[key] = (time.monotonic() + self.cache_ttl, raw)
+
+    def __delitem__(self, key):
+        self._cache.pop(key, None)
+        cursor = _conn().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self):
+        rows = _conn().execute("SELECT key FROM kv WHERE namespace = ? ORDER BY rowid", (self.namespace,))
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        return _conn().execute("SELECT COUNT(*) FROM kv WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def items(self):
+        rows = _conn().execute("SELECT key, value FROM kv WHERE namespace = ? ORDER BY rowid", (self.namespace,))
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def find(self, field: str, value) -> list:
+        """Return every value whose top-level `field` equals `value`."""
+        rows = _conn().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND json_extract(value, ?) = ? ORDER BY rowid",
+            (self.namespace, f"$.{field}", value),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+
+# Uploaded document metadata: doc_id -> {"filename", "path", "sha256", "bytes", "status"}
+uploaded_docs = PersistentMapping("documents")
+
+# SHA-256 of uploaded PDF bytes -> canonical doc_id, used to skip re-ingesting duplicates
+doc_hashes = PersistentMapping("doc_hashes")
+
+# Ingestion job records: job_id -> job record (see app/jobs.py)
+job_records = PersistentMapping("jobs")
+
+
+# --- Conversation history per document ---
+
+def append_chat_turn(doc_id: str, turn: dict) -> dict:
+    """
+    Store a chat turn and evict turns beyond HISTORY_MAX_TURNS / HISTORY_MAX_AGE_DAYS.
+
+    Returns:
+        dict: The stored turn, with its "id" and "created_at".
+    """
+    now = time.time()
+    conn = _conn()
+    cursor = conn.execute(
+        "INSERT INTO chat_turns (doc_id, turn, created_at) VALUES (?, ?, ?)", (doc_id, json.dumps(turn), now)
+    )
+    if HISTORY_MAX_TURNS > 0:
+        conn.execute(
+            "DELETE FROM chat_turns WHERE doc_id = ? AND id <= ("
+            "SELECT id FROM chat_turns WHERE doc_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (doc_id, doc_id, HISTORY_MAX_TURNS),
+        )
+    if HISTORY_MAX_AGE_DAYS > 0:
+        conn.execute(
+            "DELETE FROM chat_turns WHERE doc_id = ? AND created_at < ?",
+            (doc_id, now - HISTORY_MAX_AGE_DAYS * 86400),
+        )
+    return {**turn, "id": cursor.lastrowid, "created_at": now}
+
+
+def get_chat_history(doc_id: str, limit: int = None, before: int = None) -> list[dict]:
+    """
+    Return a document's chat turns in chronological order.
+
+    Args:
+        doc_id: Document whose history to read.
+        limit: Return only the newest `limit` turns (of those matching `before`).
+        before: Only turns with an id lower than this (for paging backwards).
+    """
+    query = "SELECT id, turn, created_at FROM chat_turns WHERE doc_id = ?"
+    params = [doc_id]
+    if before is not None:
+        query += " AND id < ?"
+        params.append(before)
+    query += " ORDER BY id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    rows = _conn().execute(query, params).fetchall()
+    return [{**json.loads(turn), "id": turn_id, "created_at": created_at} for turn_id, turn, created_at in reversed(rows)]
+
+
+def clear_chat_history(doc_id: str):
+    _conn().execute("DELETE FROM chat_turns WHERE doc_id = ?", (doc_id,))
@@ -0,0 +1,83 @@
+# app/uploads.py
+
+import os
+import asyncio
+import hashlib
+
+from starlette.responses import JSONResponse
+
+# --- Configuration ---
+# Largest accepted PDF, in megabytes
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "100"))
+UPLOAD_MAX_BYTES = int(UPLOAD_MAX_MB * 1024 * 1024)
+# Bytes copied (and hashed) per read
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Allowance for the multipart framing around the file in Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _copy_upload(source, dest_path: str, max_bytes: int, chunk_size: int) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, "wb") as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the {UPLOAD_MAX_MB:g} MB upload limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        # Never leave a partial file behind
+        try:
+            os.remove(dest_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return digest.hexdigest(), size
+
+
+async def save_upload(file, dest_path: str, max_bytes: int = UPLOAD_MAX_BYTES) -> tuple[str, int]:
+    """
+    Copy an UploadFile to `dest_path` in UPLOAD_CHUNK_SIZE pieces, hashing and
+    counting the bytes in the same pass. Runs on a worker thread, so memory
+    per upload is one chunk and the event loop isn't blocked by disk I/O.
+
+    Returns:
+        tuple: (sha256 hex digest, size in bytes)
+
+    Raises:
+        UploadTooLarge: The file is larger than `max_bytes` (nothing is kept).
+    """
+    await file.seek(0)
+    return await asyncio.to_thread(_copy_upload, file.file, dest_path, max_bytes, UPLOAD_CHUNK_SIZE)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject uploads whose declared Content-Length is over the limit with a 413
+    before any of the body is read or spooled.
+    """
+
+    def __init__(self, app, path: str = "/upload/", max_bytes: int = UPLOAD_MAX_BYTES):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == self.path:
+            length = dict(scope["headers"]).get(b"content-length")
+            if length is not None and length.isdigit() and int(length) > self.max_bytes + MULTIPART_OVERHEAD:
+                response = JSONResponse(
+                    {"error": f"File exceeds the {UPLOAD_MAX_MB:g} MB upload limit"}, status_code=413
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -1,17 +1,23 @@
 # app/utils.py
 
 import os
-import uuid
+import time
 import base64
+import threading
+import multiprocessing
 from io import BytesIO
-import pdfplumber
-from groq import Groq
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from qdrant_client.http import models
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-# Import your embeddings function and Qdrant client
-from .embeddings import embed_text
-from .qdrant_client import qdrant, COLLECTION_NAME
+# Import your embeddings function and vector store
+# (pdfplumber and groq are imported where used to keep app startup fast)
+from .embeddings import embed_bulk, EMBED_BULK_BATCH_SIZE, EMBED_BULK_PROCESSES
+from .vector_store import get_vector_store
+from .chunker import iter_chunk_records, CHUNK_SIZE, CHUNK_OVERLAP
+from . import lexical_index
+from . import metrics
+from . import groq_scheduler
+from . import ocr_cache
 
 # --- Define Directories Relative to this file ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -22,42 +28,113 @@ AI_DIR = os.path.join(BASE_DIR, "AI")
 os.makedirs(TEXT_DIR, exist_ok=True)
 os.makedirs(AI_DIR, exist_ok=True)
 
+# Maximum number of page images sent to the VLM at the same time
+VLM_CONCURRENCY = int(os.getenv("VLM_CONCURRENCY", "4"))
 
-def extract_text_from_pdf(file_path: str) -> str:
+# Shared pool for VLM calls; bounds OCR concurrency across all ingestion jobs
+_vlm_executor = ThreadPoolExecutor(max_workers=VLM_CONCURRENCY, thread_name_prefix="vlm")
+
+# Worker processes for text-layer extraction (1 disables the process pool)
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", str(os.cpu_count() or 1)))
+# PDFs with fewer pages than this are always read in-process
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+# Chunks embedded and upserted together by the streaming ingestion pipeline. The default
+# gives every bulk-embedding worker one full inference batch per ingestion batch
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", str(EMBED_BULK_BATCH_SIZE * max(1, EMBED_BULK_PROCESSES))))
+# The first batch is kept small so a new document becomes searchable early
+INGEST_FIRST_BATCH_SIZE = int(os.getenv("INGEST_FIRST_BATCH_SIZE", "64"))
+# Seconds between page-progress reports while a batch is being filled
+INGEST_PROGRESS_INTERVAL = 1.0
+
+# Stages timed by `ingest_pdf`
+INGEST_STAGES = ("extracting", "chunking", "embedding", "storing")
+
+
+def extract_text_from_pdf(file_path: str, processes: int = None) -> str:
     """
     Extract text from PDF and add a page marker for each page.
+
+    Args:
+        file_path: Path to the PDF.
+        processes: Worker processes for the text layer. Defaults to
+                   PDF_EXTRACT_PROCESSES; small PDFs always stay in-process.
     """
     # Default threshold: if extracted characters < threshold -> use VLM (image OCR)
-    return extract_text_from_pdf_with_vlm(file_path)
+    return extract_text_from_pdf_with_vlm(file_path, processes=processes)
 
 
-def _call_groq_vlm_with_image_bytes(image_bytes: bytes, model: str = "meta-llama/llama-4-scout-17b-16e-instruct") -> str:
-    """Send image bytes to Groq VLM and return text result.
+def _get_extract_pool(processes: int) -> ProcessPoolExecutor:
+    """Return the shared text-extraction process pool, creating it on first use."""
+    global _extract_pool
+    if _extract_pool is None:
+        with _extract_pool_lock:
+            if _extract_pool is None:
+                # spawn, not fork: the parent has ONNX and HTTP threads running
+                _extract_pool = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _extract_pool
+
+
+def _iter_text_layer(pdf, file_path: str, processes: int):
+    """
+    Yield (page_index, text) for every page of an open PDF, in page order.
 
-    Expects GROQ_API_KEY in environment.
+    Large PDFs are split into page ranges that are extracted on the process
+    pool; everything else is read page by page in this process.
     """
-    api_key = os.environ.get("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("GROQ_API_KEY not set in environment")
+    num_pages = len(pdf.pages)
+    if processes <= 1 or num_pages < PDF_PARALLEL_MIN_PAGES:
+        for index, page in enumerate(pdf.pages):
+            yield index, page.extract_text() or ""
+        return
+
+    from .pdf_text import extract_page_range
+
+    # A few shards per worker so one slow range doesn't hold up the rest
+    shard_size = max(1, -(-num_pages // (processes * 4)))
+    pool = _get_extract_pool(processes)
+    shards = [
+        (start, pool.submit(extract_page_range, file_path, start, min(start + shard_size, num_pages)))
+        for start in range(0, num_pages, shard_size)
+    ]
+    for start, future in shards:
+        for offset, text in enumerate(future.result()):
+            yield start + offset, text
+
 
-    client = Groq(api_key=api_key)
+# Instruction sent with every page image (part of the OCR cache key)
+VLM_PROMPT = "Describe the contents of this page and extract any readable text."
 
+
+def _call_groq_vlm_with_image_bytes(image_bytes: bytes, model: str = "meta-llama/llama-4-scout-17b-16e-instruct") -> str:
+    """Send image bytes to Groq VLM and return text result.
+
+    Expects GROQ_API_KEY in environment. The call goes through the Groq
+    scheduler at background priority, so OCR yields to chat requests.
+    """
     # encode bytes to base64 data URI
     b64 = base64.b64encode(image_bytes).decode("utf-8")
     data_uri = f"data:image/jpeg;base64,{b64}"
 
-    chat_completion = client.chat.completions.create(
-        messages=[
+    params = {
+        "messages": [
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": "Describe the contents of this page and extract any readable text."},
+                    {"type": "text", "text": VLM_PROMPT},
                     {"type": "image_url", "image_url": {"url": data_uri}},
                 ],
             }
         ],
-        model=model,
-    )
+        "model": model,
+    }
+    chat_completion = groq_scheduler.complete(params, priority=groq_scheduler.BACKGROUND)
 
     # The Groq response content can be a string or a list of message pieces
     content = chat_completion.choices[0].message.content
@@ -74,90 +151,241 @@ def _call_groq_vlm_with_image_bytes(image_bytes: bytes, model: str = "meta-llama
     return str(content)
 
 
-def extract_text_from_pdf_with_vlm(file_path: str, threshold: int = 200, vlm_model: str = "meta-llama/llama-4-scout-17b-16e-instruct") -> str:
+def _render_page_jpeg(page, resolution: int = 150) -> bytes:
+    """Render a pdfplumber page to JPEG bytes."""
+    pil_img = page.to_image(resolution=resolution).original.convert("RGB")
+    buf = BytesIO()
+    pil_img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _ocr_page(image_bytes: bytes, vlm_model: str, page_number: int, fallback_text: str, cache_key: str = None) -> str:
+    """
+    Run the VLM on one rendered page, falling back to the text layer on failure.
+    Successful results are stored in the OCR cache under `cache_key`.
+    """
+    try:
+        with metrics.timed("ocr_page"):
+            text = _call_groq_vlm_with_image_bytes(image_bytes, model=vlm_model)
+        if cache_key is not None:
+            ocr_cache.put(cache_key, vlm_model, text)
+        return text
+    except Exception as e:
+        # If image->VLM fails, fall back to whatever text we have (maybe empty)
+        return fallback_text or f"[unreadable page {page_number}: error {e}]"
+
+
+def iter_pdf_pages(
+    file_path: str,
+    threshold: int = 200,
+    vlm_model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+    max_concurrency: int = VLM_CONCURRENCY,
+    processes: int = None,
+):
     """
-    Extract text from PDF page-by-page. If the page's extracted text length is below
-    `threshold`, treat it as scanned/poor text and send the page image to Groq VLM.
+    Yield (page_number, text) for every page of a PDF, in page order.
 
-    Returns a single string with page markers: '--- Page N ---\n<page text>\n'.
+    If the page's extracted text length is below `threshold`, treat it as
+    scanned/poor text and send the page image to Groq VLM. Pages needing OCR are
+    rendered here, looked up in the OCR cache (keyed on the image, model and
+    prompt) and only handed to the VLM pool on a miss, so text-layer pages keep being
+    processed while up to `max_concurrency` OCR calls for this document are in
+    flight. The text layer of large PDFs is read on a process pool (see
+    `extract_text_from_pdf`).
+
+    Pages are released as soon as they have been handed over, so memory stays
+    bounded by the OCR window rather than the document size.
     """
-    all_text = ""
+    import pdfplumber
+
+    if processes is None:
+        processes = PDF_EXTRACT_PROCESSES
+
+    # Limits rendered-but-unfinished pages, so images don't pile up ahead of the VLM
+    in_flight = threading.BoundedSemaphore(max(1, max_concurrency))
+    # Pages not yet yielded, as (page_number, text or Future); capped so text pages
+    # don't accumulate behind a slow OCR call
+    waiting = deque()
+    max_waiting = 4 * max(1, max_concurrency)
+
     with pdfplumber.open(file_path) as pdf:
-        for i, page in enumerate(pdf.pages, start=1):
-            page_text = page.extract_text() or ""
-            if len((page_text or "").strip()) >= threshold:
-                chosen_text = page_text
+        for index, page_text in _iter_text_layer(pdf, file_path, processes):
+            i = index + 1
+            if len(page_text.strip()) >= threshold:
+                waiting.append((i, page_text))
+                metrics.ingest_pages_total.inc(source="text")
             else:
-                # Render page to image and send to VLM
+                in_flight.acquire()
                 try:
-                    pil_img = page.to_image(resolution=150).original.convert("RGB")
-                    buf = BytesIO()
-                    pil_img.save(buf, format="JPEG", quality=85)
-                    image_bytes = buf.getvalue()
-                    vlm_text = _call_groq_vlm_with_image_bytes(image_bytes, model=vlm_model)
-                    chosen_text = vlm_text
+                    image_bytes = _render_page_jpeg(pdf.pages[index])
                 except Exception as e:
-                    # If image->VLM fails, fall back to whatever text we have (maybe empty)
-                    chosen_text = page_text or f"[unreadable page {i}: error {e}]"
+                    in_flight.release()
+                    waiting.append((i, page_text or f"[unreadable page {i}: error {e}]"))
+                else:
+                    cache_key = ocr_cache.page_key(image_bytes, vlm_model, VLM_PROMPT)
+                    cached = ocr_cache.get(cache_key)
+                    if cached is not None:
+                        in_flight.release()
+                        waiting.append((i, cached))
+                        metrics.ingest_pages_total.inc(source="ocr_cache")
+                    else:
+                        future = _vlm_executor.submit(_ocr_page, image_bytes, vlm_model, i, page_text, cache_key)
+                        metrics.ingest_pages_total.inc(source="ocr")
+                        future.add_done_callback(lambda _: in_flight.release())
+                        waiting.append((i, future))
+            # Drop pdfplumber's cached layout objects for this page
+            pdf.pages[index].close()
 
-            # Add page marker at the start of each page
-            all_text += f"--- Page {i} ---\n{chosen_text}\n"
+            while waiting and (
+                isinstance(waiting[0][1], str) or waiting[0][1].done() or len(waiting) > max_waiting
+            ):
+                page_number, item = waiting.popleft()
+                yield page_number, item if isinstance(item, str) else item.result()
 
-    return all_text
+        while waiting:
+            page_number, item = waiting.popleft()
+            yield page_number, item if isinstance(item, str) else item.result()
 
 
-def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 100) -> list[str]:
+def extract_text_from_pdf_with_vlm(
+    file_path: str,
+    threshold: int = 200,
+    vlm_model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+    max_concurrency: int = VLM_CONCURRENCY,
+    processes: int = None,
+) -> str:
+    """
+    Extract text from PDF page-by-page, using the VLM for scanned pages
+    (see `iter_pdf_pages`).
+
+    Returns a single string with page markers: '--- Page N ---\n<page text>\n'.
+    """
+    pages = iter_pdf_pages(file_path, threshold, vlm_model, max_concurrency, processes)
+    return "".join(f"--- Page {i} ---\n{text}\n" for i, text in pages)
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> list[str]:
     """
     Split text into manageable chunks for embeddings.
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-    )
-    chunks = splitter.split_text(text)
-    return chunks
-
-
-def generate_embeddings_and_store(chunks: list[str], doc_id: str):
-    """
-    Generate embeddings for each chunk and store in Qdrant.
-    Keeps correct page numbers from the PDF.
-    """
-    # Get embeddings for the chunks
-    embeddings = embed_text(chunks)
-
-    points = []
-    for chunk, emb in zip(chunks, embeddings):
-        page_number = None
-
-        # Look for the last seen "--- Page X ---" marker inside the chunk
-        if "--- Page " in chunk:
-            try:
-                marker = chunk.split("--- Page ")[-1].split("---")[0].strip()
-                page_number = int(marker)
-            except (ValueError, IndexError):
-                page_number = None
-
-        points.append(
-            models.PointStruct(
-                id=str(uuid.uuid4()),
-                vector=emb,
-                payload={
-                    "text": chunk,
-                    "doc_id": doc_id,
-                    "page": page_number,
-                },
-            )
-        )
-
-    if not points:
-        return
+    return [record["text"] for record in iter_chunk_records([(None, text)], chunk_size, chunk_overlap)]
+
+
+def _embed_chunks(chunks: list[dict], doc_id: str, start_index: int = 0):
+    """Embed a batch of chunk records (see `chunker.iter_chunk_records`) and build their payloads."""
+    embeddings = embed_bulk([chunk["text"] for chunk in chunks])
+    payloads = [
+        {
+            **chunk,
+            "doc_id": doc_id,
+            # Position in the document; identifies the chunk across retrievers
+            "chunk_index": start_index + offset,
+        }
+        for offset, chunk in enumerate(chunks)
+    ]
+    return embeddings, payloads
+
+
+def _store_chunks(store, doc_id: str, vectors, payloads: list[dict]):
+    """Write a batch to the vector store and the document's BM25 index."""
+    store.upsert(doc_id, vectors, payloads)
+    lexical_index.add_chunks(doc_id, payloads)
+
+
+def generate_embeddings_and_store(chunks: list, doc_id: str, batch_size: int = INGEST_BATCH_SIZE):
+    """
+    Generate embeddings for each chunk and store them in the vector store, `batch_size` chunks at a time.
+    Chunks are records (see `chunker.chunk_pages`), whose page numbers are kept,
+    or plain strings such as `chunk_text` returns (stored without a page).
+    """
+    chunks = [{"text": chunk, "page": None, "page_end": None} if isinstance(chunk, str) else chunk for chunk in chunks]
+    store = get_vector_store()
+    for start in range(0, len(chunks), batch_size):
+        _store_chunks(store, doc_id, *_embed_chunks(chunks[start:start + batch_size], doc_id, start))
+
 
-    qdrant.upsert(
-        collection_name=COLLECTION_NAME,
-        points=points,
-        wait=True,
-    )
+def ingest_pdf(file_path: str, doc_id: str, batch_size: int = INGEST_BATCH_SIZE, on_progress=None) -> dict:
+    """
+    Stream a PDF through page -> chunk -> embed batch -> upsert batch.
+
+    Only the current batch of chunks (plus the OCR look-ahead window) is held in
+    memory, and every batch is searchable as soon as its upsert returns.
+
+    Args:
+        file_path: Path to the PDF.
+        doc_id: Document id stored in each point's payload.
+        batch_size: Chunks per embed/upsert batch (the first one holds at most
+                    INGEST_FIRST_BATCH_SIZE).
+        on_progress: Optional callable receiving the running stats after each
+                     batch, and every INGEST_PROGRESS_INTERVAL seconds while pages
+                     are being read.
+
+    Returns:
+        dict: {"pages", "chunks", "batches", "seconds": {stage: seconds}, "chunks_per_second"}
+              (chunks_per_second is the embedding throughput)
+    """
+    stats = {"pages": 0, "chunks": 0, "batches": 0, "seconds": {stage: 0.0 for stage in INGEST_STAGES}}
+    seconds = stats["seconds"]
+    store = get_vector_store()
+    last_report = time.perf_counter()
+
+    def timed_pages():
+        nonlocal last_report
+        pages = iter_pdf_pages(file_path)
+        while True:
+            start = time.perf_counter()
+            page = next(pages, None)
+            seconds["extracting"] += time.perf_counter() - start
+            if page is None:
+                return
+            stats["pages"] += 1
+            # OCR-heavy pages can take a while to fill a batch; report them as they are read
+            if on_progress is not None and time.perf_counter() - last_report >= INGEST_PROGRESS_INTERVAL:
+                on_progress(stats)
+                last_report = time.perf_counter()
+            yield page
+
+    chunks = iter_chunk_records(timed_pages())
+    batch = []
+    while True:
+        start = time.perf_counter()
+        extracting_before = seconds["extracting"]
+        chunk = next(chunks, None)
+        # Pulling a chunk may pull pages too; only count the splitting itself
+        seconds["chunking"] += time.perf_counter() - start - (seconds["extracting"] - extracting_before)
+        if chunk is not None:
+            batch.append(chunk)
+
+        limit = batch_size if stats["batches"] else min(batch_size, INGEST_FIRST_BATCH_SIZE)
+        if batch and (chunk is None or len(batch) >= limit):
+            start = time.perf_counter()
+            vectors, payloads = _embed_chunks(batch, doc_id, stats["chunks"])
+            seconds["embedding"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            _store_chunks(store, doc_id, vectors, payloads)
+            seconds["storing"] += time.perf_counter() - start
+
+            stats["chunks"] += len(batch)
+            stats["batches"] += 1
+            batch = []
+            if on_progress is not None:
+                on_progress(stats)
+                last_report = time.perf_counter()
+
+        if chunk is None:
+            stats["chunks_per_second"] = stats["chunks"] / seconds["embedding"] if seconds["embedding"] else 0.0
+            for stage, spent in seconds.items():
+                metrics.stage_seconds.observe(spent, stage=f"ingest_{stage}")
+            return stats
+
+
+def delete_doc_vectors(doc_id: str):
+    """
+    Remove every stored chunk of a document from the vector store and its BM25 index.
+    """
+    get_vector_store().delete(doc_id)
+    lexical_index.delete(doc_id)
 
 
 def save_text_to_file(text: str, filename: str):
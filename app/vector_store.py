@@ -0,0 +1,315 @@
+# app/vector_store.py
+
+import os
+import json
+import uuid
+import shutil
+import itertools
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .embeddings import embed_text, embed_query, EMBED_DIM
+from . import metrics
+from .qdrant_client import get_qdrant, get_async_qdrant, qdrant_loaded, doc_filter, COLLECTION_NAME
+from .qdrant_profiles import get_profile, search_params
+
+# --- Configuration ---
+# "qdrant" (server at QDRANT_URL) or "local" (in-process NumPy index on disk)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(BASE_DIR, "../vector_index"))
+# Documents whose vectors stay mapped (with payloads in memory); least recently searched are dropped beyond this
+LOCAL_CACHE_DOCS = int(os.getenv("LOCAL_CACHE_DOCS", "64"))
+
+
+class ScoredChunk:
+    """Search hit with the same `id` / `score` / `payload` attributes as Qdrant's ScoredPoint."""
+
+    __slots__ = ("id", "score", "payload")
+
+    def __init__(self, id, score: float, payload: dict):
+        self.id = id
+        self.score = score
+        self.payload = payload
+
+
+class VectorStore:
+    """Interface shared by the vector store backends."""
+
+    name = None
+
+    def connect(self):
+        """Open connections / create storage so the first request doesn't pay for it."""
+
+    def loaded(self) -> bool:
+        raise NotImplementedError
+
+    def upsert(self, doc_id: str, vectors: list, payloads: list[dict]):
+        """Store one batch of chunk vectors for a document; searchable on return."""
+        raise NotImplementedError
+
+    def search(self, doc_id, vector, top_k: int) -> list:
+        """Search one document (a doc_id) or several (a list of doc_ids) in a single query."""
+        raise NotImplementedError
+
+    async def search_async(self, doc_id, vector, top_k: int) -> list:
+        return self.search(doc_id, vector, top_k)
+
+    async def search_batch_async(self, doc_id, vectors: list, top_k: int) -> list[list]:
+        """Run several searches against the same document(s) in one request."""
+        return [self.search(doc_id, vector, top_k) for vector in vectors]
+
+    def delete(self, doc_id: str):
+        raise NotImplementedError
+
+
+class QdrantStore(VectorStore):
+    """Vectors in the shared Qdrant collection, filtered by doc_id payload."""
+
+    name = "qdrant"
+
+    def __init__(self):
+        # HNSW ef / quantization rescoring matching the collection's profile
+        self.search_params = search_params(get_profile())
+
+    def connect(self):
+        get_qdrant()
+
+    def loaded(self) -> bool:
+        return qdrant_loaded()
+
+    def upsert(self, doc_id: str, vectors: list, payloads: list[dict]):
+        from qdrant_client.http import models
+
+        points = [
+            models.PointStruct(id=str(uuid.uuid4()), vector=vector, payload=payload)
+            for vector, payload in zip(vectors, payloads)
+        ]
+        if not points:
+            return
+        get_qdrant().upsert(
+            collection_name=COLLECTION_NAME,
+            points=points,
+            wait=True,
+        )
+
+    def search(self, doc_id, vector, top_k: int) -> list:
+        return get_qdrant().search(
+            collection_name=COLLECTION_NAME,
+            query_vector=vector,
+            limit=top_k,
+            query_filter=doc_filter(doc_id),
+            search_params=self.search_params,
+        )
+
+    async def search_async(self, doc_id, vector, top_k: int) -> list:
+        return await get_async_qdrant().search(
+            collection_name=COLLECTION_NAME,
+            query_vector=vector,
+            limit=top_k,
+            query_filter=doc_filter(doc_id),
+            search_params=self.search_params,
+        )
+
+    async def search_batch_async(self, doc_id, vectors: list, top_k: int) -> list[list]:
+        from qdrant_client.http import models
+
+        query_filter = doc_filter(doc_id)
+        requests = [
+            models.SearchRequest(
+                vector=list(map(float, vector)), filter=query_filter, limit=top_k,
+                params=self.search_params, with_payload=True,
+            )
+            for vector in vectors
+        ]
+        return await get_async_qdrant().search_batch(collection_name=COLLECTION_NAME, requests=requests)
+
+    def delete(self, doc_id: str):
+        from qdrant_client.http import models
+
+        get_qdrant().delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.FilterSelector(filter=doc_filter(doc_id)),
+            wait=True,
+        )
+
+
+class LocalStore(VectorStore):
+    """
+    In-process index: one directory per doc_id holding normalized float32
+    vectors (`vectors.f32`, appended batch by batch) and their payloads
+    (`payloads.jsonl`). Vectors are memory-mapped and searched by brute-force
+    dot product, which for a few thousand 384-d chunks takes microseconds.
+
+    A partition is re-mapped when its file grows, so batches written by an
+    ingestion job (or another worker process) become visible automatically.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, dim: int = EMBED_DIM):
+        self.root = root
+        self.dim = dim
+        # doc_id -> (vector file size, memmap, payloads), most recently used last
+        self._partitions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _paths(self, doc_id: str):
+        doc_dir = os.path.join(self.root, doc_id)
+        return doc_dir, os.path.join(doc_dir, "vectors.f32"), os.path.join(doc_dir, "payloads.jsonl")
+
+    def connect(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def loaded(self) -> bool:
+        return True
+
+    def upsert(self, doc_id: str, vectors: list, payloads: list[dict]):
+        if not len(vectors):
+            return
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+        doc_dir, vectors_path, payloads_path = self._paths(doc_id)
+        with self._lock:
+            os.makedirs(doc_dir, exist_ok=True)
+            # Payloads first: a reader only maps as many rows as the vector file holds
+            with open(payloads_path, "a", encoding="utf-8") as f:
+                for payload in payloads:
+                    f.write(json.dumps(payload) + "\n")
+            with open(vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+
+    def _partition(self, doc_id: str):
+        _, vectors_path, payloads_path = self._paths(doc_id)
+        try:
+            size = os.path.getsize(vectors_path)
+        except OSError:
+            return None, None
+
+        cached = self._partitions.get(doc_id)
+        if cached is not None and cached[0] == size:
+            try:
+                self._partitions.move_to_end(doc_id)
+            except KeyError:
+                # Evicted meanwhile; this search can still use it
+                pass
+            return cached[1], cached[2]
+
+        with self._lock:
+            rows = size // (4 * self.dim)
+            if rows == 0:
+                return None, None
+            matrix = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            with open(payloads_path, "r", encoding="utf-8") as f:
+                # Payloads are written before vectors, so the first `rows` lines are
+                # complete even while another process is appending the next batch
+                payloads = [json.loads(line) for line in itertools.islice(f, rows)]
+            self._partitions[doc_id] = (size, matrix, payloads)
+            self._partitions.move_to_end(doc_id)
+            while len(self._partitions) > max(1, LOCAL_CACHE_DOCS):
+                self._partitions.popitem(last=False)
+        return matrix, payloads
+
+    def search(self, doc_id, vector, top_k: int) -> list:
+        doc_ids = [doc_id] if isinstance(doc_id, str) else doc_id
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        hits = []
+        for doc_id in doc_ids:
+            matrix, payloads = self._partition(doc_id)
+            if matrix is None:
+                continue
+            scores = matrix @ query
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            hits.extend(ScoredChunk(f"{doc_id}:{int(i)}", float(scores[i]), payloads[i]) for i in top)
+
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+        return hits[:top_k]
+
+    async def search_batch_async(self, doc_id, vectors: list, top_k: int) -> list[list]:
+        doc_ids = [doc_id] if isinstance(doc_id, str) else doc_id
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        results = [[] for _ in range(len(queries))]
+        for doc_id in doc_ids:
+            matrix, payloads = self._partition(doc_id)
+            if matrix is None:
+                continue
+            # One matrix product scores every query against the document
+            scores = queries @ matrix.T
+            k = min(top_k, scores.shape[1])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, columns in enumerate(top):
+                results[row].extend(
+                    ScoredChunk(f"{doc_id}:{int(i)}", float(scores[row, i]), payloads[i]) for i in columns
+                )
+
+        for hits in results:
+            hits.sort(key=lambda hit: hit.score, reverse=True)
+            del hits[top_k:]
+        return results
+
+    def delete(self, doc_id: str):
+        doc_dir, _, _ = self._paths(doc_id)
+        with self._lock:
+            self._partitions.pop(doc_id, None)
+            shutil.rmtree(doc_dir, ignore_errors=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """Return the configured vector store backend (see VECTOR_BACKEND)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if VECTOR_BACKEND == "local":
+                    _store = LocalStore(LOCAL_INDEX_DIR)
+                elif VECTOR_BACKEND == "qdrant":
+                    _store = QdrantStore()
+                else:
+                    raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND!r}")
+    return _store
+
+
+def search_qdrant_for_doc(query: str, doc_id: str, top_k: int = 10, query_vector=None):
+    """
+    Searches the vector store for the top_k most similar vectors to the query within a specific document.
+
+    Pass `query_vector` when the query has already been embedded (e.g. via
+    `embeddings.embed_query`) to skip embedding it again.
+    """
+    if not query or not doc_id:
+        return []
+
+    query_emb = query_vector if query_vector is not None else embed_text([query])[0]
+    with metrics.timed("vector_search"):
+        return get_vector_store().search(doc_id, query_emb, top_k)
+
+
+async def search_qdrant_for_doc_async(query: str, doc_id: str, top_k: int = 10, query_vector=None):
+    """
+    Async variant of `search_qdrant_for_doc` for use on the event loop.
+
+    The query is embedded through the micro-batching service and the search
+    goes through the backend's async path, so concurrent questions overlap
+    their I/O instead of blocking each other.
+    """
+    if not query or not doc_id:
+        return []
+
+    query_emb = query_vector if query_vector is not None else await embed_query(query)
+    with metrics.timed("vector_search"):
+        return await get_vector_store().search_async(doc_id, query_emb, top_k)
@@ -0,0 +1,135 @@
+# Recall / latency / memory comparison of the Qdrant collection profiles
+# (app/qdrant_profiles.py) on the chunk texts in chunks/.
+#
+#   python benchmark_profiles.py --limit 5000 --queries 200
+#
+# Each profile gets a temporary collection on QDRANT_URL, which is dropped
+# afterwards. Run it against a real Qdrant server: local mode ignores
+# quantization and HNSW settings.
+
+import os
+import glob
+import time
+import uuid
+import random
+import hashlib
+import argparse
+
+import numpy as np
+
+from app.chunker import chunk_pages
+from app.embeddings import embed_bulk
+from app.qdrant_client import get_qdrant, COLLECTION_NAME
+from app.qdrant_profiles import PROFILES, get_profile, collection_config, search_params, estimate_ram_bytes
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHUNKS_DIR = os.path.join(BASE_DIR, "chunks")
+
+
+def load_chunks(limit: int) -> list[str]:
+    """Re-chunk every distinct text file in chunks/ and return up to `limit` chunks."""
+    seen, chunks = set(), []
+    for path in sorted(glob.glob(os.path.join(CHUNKS_DIR, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        chunks.extend(record["text"] for record in chunk_pages([(None, text)]))
+    return chunks[:limit]
+
+
+def embed(texts: list[str]) -> np.ndarray:
+    matrix = np.asarray(embed_bulk(texts), dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def wait_until_indexed(client, name: str, timeout: float = 600):
+    from qdrant_client.http import models
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if client.get_collection(name).status == models.CollectionStatus.GREEN:
+            return
+        time.sleep(0.5)
+    raise TimeoutError(f"{name} was not indexed within {timeout:.0f}s")
+
+
+def bench_profile(client, profile: dict, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, top_k: int) -> dict:
+    from qdrant_client.http import models
+
+    name = f"{COLLECTION_NAME}_bench_{profile['name']}"
+    client.recreate_collection(
+        collection_name=name,
+        # Build the HNSW graph right away so the numbers reflect indexed search
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
+        **collection_config(profile),
+    )
+    try:
+        for start in range(0, len(vectors), 512):
+            batch = vectors[start:start + 512]
+            client.upsert(
+                collection_name=name,
+                points=[
+                    models.PointStruct(id=str(uuid.uuid4()), vector=vector.tolist(), payload={"row": start + i})
+                    for i, vector in enumerate(batch)
+                ],
+                wait=True,
+            )
+        wait_until_indexed(client, name)
+
+        params = search_params(profile)
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = client.search(
+                collection_name=name, query_vector=query.tolist(), limit=top_k, search_params=params
+            )
+            latencies.append(time.perf_counter() - start)
+            hits += len({r.payload["row"] for r in results} & set(expected.tolist()))
+
+        return {
+            "profile": profile["name"],
+            "recall": hits / truth.size,
+            "p50_ms": np.percentile(latencies, 50) * 1000,
+            "p95_ms": np.percentile(latencies, 95) * 1000,
+            "ram_mb": estimate_ram_bytes(len(vectors), profile) / 2**20,
+        }
+    finally:
+        client.delete_collection(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Qdrant collection profiles on chunks/.")
+    parser.add_argument("--limit", type=int, default=5000, help="chunks to index")
+    parser.add_argument("--queries", type=int, default=200, help="queries to run per profile")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--profiles", nargs="*", default=list(PROFILES))
+    args = parser.parse_args()
+
+    print("1. Loading and embedding chunks...")
+    chunks = load_chunks(args.limit)
+    vectors = embed(chunks)
+    print(f"   {len(chunks)} chunks")
+
+    # Queries: the opening sentence of randomly picked chunks
+    random.seed(0)
+    picked = random.sample(range(len(chunks)), min(args.queries, len(chunks)))
+    queries = embed([chunks[i].split(". ")[0][:200] for i in picked])
+
+    print("2. Exact top-k for recall...")
+    top_k = min(args.top_k, len(chunks))
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :top_k]
+
+    print("3. Benchmarking profiles...")
+    client = get_qdrant()
+    rows = [bench_profile(client, get_profile(name), vectors, queries, truth, top_k) for name in args.profiles]
+
+    print(f"\n{'profile':<16}{'recall@' + str(top_k):>10}{'p50 ms':>10}{'p95 ms':>10}{'est. RAM MB':>14}")
+    for row in rows:
+        print(f"{row['profile']:<16}{row['recall']:>10.3f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['ram_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
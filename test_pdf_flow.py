@@ -1,7 +1,7 @@
 import asyncio
 import os
 from app.utils import extract_text_to_file, chunk_text_and_save, generate_embeddings_and_store
-from app.qdrant_client import search_qdrant_for_doc
+from app.vector_store import search_qdrant_for_doc
 from app.genai_client import answer_with_groq_async
 
 # Set paths for a test PDF